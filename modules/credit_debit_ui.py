@@ -1,10 +1,12 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 import os
+import re
 from openpyxl import Workbook, load_workbook
 import logging
 import traceback
 from collections import Counter
+from itertools import chain
 
 # Attempt to import processor functions
 try:
@@ -39,6 +41,7 @@ except ImportError as e_import_telemetry:
         pass
 
 PLACEHOLDER_TEXT = "Code"
+BRANCH_KEY_PATTERN = re.compile(r"[^_.-]*")  # File name prefix up to the first '_', '-' or '.' is the branch code
 
 class CustomErrorDialog(tk.Toplevel): # Your CustomErrorDialog code remains the same
     def __init__(self, parent, title, message, error_details_to_copy):
@@ -102,10 +105,11 @@ class CreditDebitNoteProcessorUI: # Your UI class code remains largely the same
     def __init__(self, root_window):
         self.root = root_window
         self.root.title("Process Credit / Debit Notes")
-        self.credit_note_files = []
-        self.debit_note_files = []
+        self.credit_note_files = {}  # filepath -> branch_code, in the order the files were added
+        self.debit_note_files = {}  # filepath -> branch_code, in the order the files were added
         self.template_file = None
         self.base_height = 500
+        self.root.geometry(f"500x{self.base_height}")  # Later resizes happen only when the warning toggles
         # ... (rest of your __init__ method as provided) ...
         tk.Label(self.root, text="Process Credit / Debit Notes", font=("Arial", 16, "bold")).pack(pady=5)
         main_frame = tk.Frame(self.root)
@@ -167,31 +171,25 @@ class CreditDebitNoteProcessorUI: # Your UI class code remains largely the same
             filetypes=[("Excel Files", "*.xlsx *.xls")]
         )
         for file_path in files:
-            if not any(f[0] == file_path for f in file_list):
+            if file_path not in file_list:
                 base = os.path.basename(file_path)
-                extracted_branch_key = base.split('_')[0].split('-')[0].split('.')[0] if base else ""
+                extracted_branch_key = BRANCH_KEY_PATTERN.match(base).group()
                 if extracted_branch_key == os.path.splitext(base)[0]:
                     stored_branch_code = ""
                 else:
                     stored_branch_code = extracted_branch_key.strip()
-                file_list.append((file_path, stored_branch_code))
+                file_list[file_path] = stored_branch_code
                 display_branch_code = stored_branch_code if stored_branch_code else PLACEHOLDER_TEXT
-                tree_widget.insert("", tk.END, values=(os.path.basename(file_path), display_branch_code))
+                # The row's item id is its file path, so selected rows map straight to file_list keys
+                tree_widget.insert("", tk.END, iid=file_path, values=(base, display_branch_code))
         self.update_process_button_state()
 
     def _delete_file_from_tree(self, file_list, tree_widget): # Your method
         selected_items = tree_widget.selection()
         if not selected_items: return
-        items_to_remove_from_list = []
-        for item_id in selected_items:
-            filename_in_tree = tree_widget.item(item_id, "values")[0]
-            for i, (fp, stored_bc) in enumerate(file_list):
-                if os.path.basename(fp) == filename_in_tree:
-                    items_to_remove_from_list.append(file_list[i])
-                    break
-            tree_widget.delete(item_id)
-        for item_tuple in items_to_remove_from_list:
-            if item_tuple in file_list: file_list.remove(item_tuple)
+        for item_id in selected_items:  # Item ids are the file paths
+            file_list.pop(item_id, None)
+        tree_widget.delete(*selected_items)  # One Tcl call for the whole selection
         self.update_process_button_state()
 
     def _edit_branch_code(self, event, file_list, tree_widget): # Your method
@@ -199,13 +197,9 @@ class CreditDebitNoteProcessorUI: # Your UI class code remains largely the same
         column_id = tree_widget.identify_column(event.x)
         if not item_id or column_id != "#2": return
         current_filename_display = tree_widget.item(item_id, "values")[0]
-        list_idx = -1
-        try:
-            for i, (fp, bc) in enumerate(file_list):
-                if os.path.basename(fp) == current_filename_display: list_idx = i; break
-        except ValueError: logging.error(f"Item ID {item_id} not found in tree. This should not happen."); return
-        if list_idx == -1: logging.error(f"Could not find {current_filename_display} in list for editing."); return
-        stored_branch_code = file_list[list_idx][1]
+        file_path = item_id  # Item ids are the file paths
+        if file_path not in file_list: logging.error(f"Could not find {current_filename_display} in list for editing."); return
+        stored_branch_code = file_list[file_path]
         entry = tk.Entry(tree_widget)
         entry.insert(0, stored_branch_code if stored_branch_code else "")
         if stored_branch_code: entry.select_range(0, tk.END)
@@ -214,7 +208,7 @@ class CreditDebitNoteProcessorUI: # Your UI class code remains largely the same
         entry.focus_set()
         def save_branch_code(evt):
             new_branch_code_input = entry.get().strip()
-            file_list[list_idx] = (file_list[list_idx][0], new_branch_code_input)
+            file_list[file_path] = new_branch_code_input
             display_text_for_tree = new_branch_code_input if new_branch_code_input else PLACEHOLDER_TEXT
             tree_widget.item(item_id, values=(current_filename_display, display_text_for_tree))
             entry.destroy()
@@ -235,16 +229,19 @@ class CreditDebitNoteProcessorUI: # Your UI class code remains largely the same
     def clear_template(self): self.template_file = None; self.template_label.config(text="No file selected")
     def update_process_button_state(self): # Your method
         has_any_files = bool(self.credit_note_files or self.debit_note_files)
-        all_files_with_codes = self.credit_note_files + self.debit_note_files
-        missing_branch_code = any(not code.strip() or code == PLACEHOLDER_TEXT for _, code in all_files_with_codes)
+        missing_branch_code = any(not code.strip() or code == PLACEHOLDER_TEXT
+                                  for code in chain(self.credit_note_files.values(), self.debit_note_files.values()))
         if missing_branch_code and has_any_files:
-            if not self.warning_frame.winfo_ismapped(): self.warning_frame.pack(pady=5, padx=10, fill=tk.X, after=self.process_btn)
-            self.warning_title.pack(pady=(5, 0))
-            self.warning_text.config(text="Warning: Branch Code is missing. Please double-click to edit or check 'Ignore Warning'.")
-            self.warning_text.pack(pady=2); self.ignore_check.pack(pady=2)
-            self.root.update_idletasks()
-            current_warning_frame_height = self.warning_frame.winfo_reqheight()
-            self.root.geometry(f"500x{self.base_height + current_warning_frame_height + 10}")
+            # Layout and window size only change when the warning appears or disappears, so the forced
+            # layout pass (update_idletasks) and geometry call are skipped while its state is unchanged
+            if not self.warning_frame.winfo_ismapped():
+                self.warning_frame.pack(pady=5, padx=10, fill=tk.X, after=self.process_btn)
+                self.warning_title.pack(pady=(5, 0))
+                self.warning_text.config(text="Warning: Branch Code is missing. Please double-click to edit or check 'Ignore Warning'.")
+                self.warning_text.pack(pady=2); self.ignore_check.pack(pady=2)
+                self.root.update_idletasks()
+                current_warning_frame_height = self.warning_frame.winfo_reqheight()
+                self.root.geometry(f"500x{self.base_height + current_warning_frame_height + 10}")
             if self.ignore_var.get(): self.process_btn.config(state=tk.NORMAL, bg="light green")
             else: self.process_btn.config(state=tk.DISABLED, bg="light grey")
         else:
@@ -252,7 +249,7 @@ class CreditDebitNoteProcessorUI: # Your UI class code remains largely the same
                 self.warning_frame.pack_forget(); self.warning_title.pack_forget()
                 self.warning_text.pack_forget(); self.ignore_check.pack_forget()
                 self.root.update_idletasks()
-            self.root.geometry(f"500x{self.base_height}")
+                self.root.geometry(f"500x{self.base_height}")
             if has_any_files: self.process_btn.config(state=tk.NORMAL, bg="light green")
             else: self.process_btn.config(state=tk.DISABLED, bg="light grey")
 
@@ -261,16 +258,16 @@ class CreditDebitNoteProcessorUI: # Your UI class code remains largely the same
             messagebox.showerror("Error", "No Credit Note or Debit Note files selected for processing.")
             return
 
-        all_files_with_codes = self.credit_note_files + self.debit_note_files
-        missing_branch_code_strict = any(not code.strip() or code == PLACEHOLDER_TEXT for _, code in all_files_with_codes)
+        missing_branch_code_strict = any(not code.strip() or code == PLACEHOLDER_TEXT
+                                         for code in chain(self.credit_note_files.values(), self.debit_note_files.values()))
         if missing_branch_code_strict and not self.ignore_var.get():
             messagebox.showwarning("Branch Code Missing", "Please review branch codes (cannot be empty or placeholder) or check 'Ignore Warning' to proceed.")
             self.update_process_button_state()
             return
 
         default_branch = "Default_Branch" # Renamed for clarity
-        credit_notes_to_process = [(f, c.strip() if (c.strip() and c != PLACEHOLDER_TEXT) else default_branch) for f, c in self.credit_note_files]
-        debit_notes_to_process = [(f, c.strip() if (c.strip() and c != PLACEHOLDER_TEXT) else default_branch) for f, c in self.debit_note_files]
+        credit_notes_to_process = [(f, c.strip() if (c.strip() and c != PLACEHOLDER_TEXT) else default_branch) for f, c in self.credit_note_files.items()]
+        debit_notes_to_process = [(f, c.strip() if (c.strip() and c != PLACEHOLDER_TEXT) else default_branch) for f, c in self.debit_note_files.items()]
 
         output_save_path = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=[("Excel Files", "*.xlsx")],
                                                  title="Save Combined Report As", initialfile="Processed_Credit_Debit_Notes.xlsx")
@@ -14,6 +14,13 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 # --- Constants ---
 INDIAN_NUMBER_FORMAT = r"[>=10000000]##\,##\,##\,##0.00;[>=100000]##\,##\,##0.00;##,##0.00;-;"
 
+# Shared style objects, built once instead of per cell
+TITLE_FONT = Font(bold=True, size=12)
+HEADER_FONT = Font(bold=True)
+HEADER_FILL = PatternFill(start_color="D9D9D9", end_color="D9D9D9", fill_type="solid")
+CENTER_ALIGNMENT = Alignment(horizontal="center", vertical="center")
+TOTAL_FONT = Font(bold=True, color="FF0000")
+
 # Standardized Fixed Headers for Credit/Debit Notes
 # These are the headers that will appear in the output Excel sheets.
 NOTE_FIXED_HEADERS = [
@@ -94,13 +101,13 @@ def create_or_replace_sheet(wb, sheet_name, title_text, columns):
     ws.merge_cells(start_row=1, start_column=1, end_row=1, end_column=len(columns))
     cell = ws.cell(row=1, column=1)
     cell.value = title_text
-    cell.font = Font(bold=True, size=12)
-    cell.alignment = Alignment(horizontal="center", vertical="center")
+    cell.font = TITLE_FONT
+    cell.alignment = CENTER_ALIGNMENT
     for idx, col in enumerate(columns, start=1):
         header_cell = ws.cell(row=2, column=idx, value=col)
-        header_cell.font = Font(bold=True)
-        header_cell.fill = PatternFill(start_color="D9D9D9", end_color="D9D9D9", fill_type="solid")
-        header_cell.alignment = Alignment(horizontal="center", vertical="center")
+        header_cell.font = HEADER_FONT
+        header_cell.fill = HEADER_FILL
+        header_cell.alignment = CENTER_ALIGNMENT
     ws.freeze_panes = "B3" # Freeze above data rows, assuming A column might be Sr.No. or similar
     logging.info(f"Finished creating sheet: {sheet_name}")
     return ws
@@ -155,7 +162,7 @@ def add_total_row(ws, columns, start_row, end_row):
     ws.append(total_row_data)
     for col_idx, value in enumerate(total_row_data, start=1):
         cell = ws.cell(row=row_num, column=col_idx)
-        cell.font = Font(bold=True, color="FF0000")
+        cell.font = TOTAL_FONT
         if isinstance(value, (int, float)):
             cell.number_format = INDIAN_NUMBER_FORMAT # Use global format
     logging.debug(f"Finished adding total row for sheet: {ws.title}")
@@ -528,7 +535,7 @@ def process_credit_data(input_files, template_file=None, existing_wb=None):
             total_row_num_on_sheet = summary_data_start_row + rows_added_sum
             for c_idx_sum, val_iter in enumerate(total_row_sum_vals, 1):
                 cell_sum_total = ws_summary.cell(row=total_row_num_on_sheet, column=c_idx_sum)
-                cell_sum_total.font = Font(bold=True, color="FF0000")
+                cell_sum_total.font = TOTAL_FONT
                 if isinstance(val_iter, (int, float)) and summary_headers[c_idx_sum -1] not in ['Month', 'No. of Notes']:
                     cell_sum_total.number_format = INDIAN_NUMBER_FORMAT
         apply_format_and_autofit(ws_summary, summary_headers, col_format_map=summary_col_format_map, start_row=summary_data_start_row)
@@ -1,13 +1,16 @@
-import tkinter as tk  # Kept for messagebox, consider removing if UI fully decouples
-from tkinter import filedialog, messagebox  # Used for error popups directly in processor
 from openpyxl import load_workbook, Workbook
-from openpyxl.styles import Font, Alignment, PatternFill
+from openpyxl.styles import Font, Alignment, PatternFill, NamedStyle
 from openpyxl.utils import get_column_letter
+from openpyxl.cell import WriteOnlyCell
 import datetime
 import os
-# import pyperclip # Removed as UI/main block is removed
+import sys
 import logging
 import math
+from functools import lru_cache
+from operator import itemgetter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -18,6 +21,7 @@ SECTION_TITLES = [
     ("PUR-Total_sws", "Purchase Register - Total - Supplier wise"),
     ("PUR-Summary-Total", "Purchase Register - Total - Summary"),
 ]
+SECTION_TITLE_MAP = dict(SECTION_TITLES) # Sheet name -> display title
 
 # Define headers to exclude from total calculation (case-sensitive, matches final_headers)
 EXCLUDE_FROM_TOTAL_HEADERS = [
@@ -52,26 +56,112 @@ EXCLUDE_HEADERS_FROM_CRDR_CHECK = [
     'Voucher Ref. No'  # This will be an extra header if present
 ]
 
+# Mapping from lowercase source header keys to the standardized header names (case-sensitive)
+SOURCE_KEY_TO_STANDARD_HEADER = {
+    'gstin/uin': 'GSTIN/UIN of Supplier',
+    'particulars': 'Supplier Name',
+    'supplier invoice no.': 'Supplier Invoice Number',
+    'supplier invoice no': 'Supplier Invoice Number',
+    'date': 'Invoice Date',  # This is the transaction date from Tally
+    'supplier invoice date': 'Supplier Invoice Date',  # Actual invoice date from supplier
+    'voucher type': 'Invoice Type',
+    'voucher no.': 'Voucher Number',
+    'voucher no': 'Voucher Number',
+    'gross total': 'Invoice Value',  # Tally's Gross Total
+    'invoice value': 'Invoice Value',  # Alternative common name
+    'igst': 'Integrated Tax',
+    'cgst': 'Central Tax',
+    'sgst': 'State/UT Tax',
+    'cess': 'Cess',
+    'round off': 'Round Off',
+    'voucher ref. no': 'Voucher Ref. No',
+    'voucher ref. no.': 'Voucher Ref. No',
+    # 'value', 'purchase gst', 'purchase igst' are handled for 'Taxable Value'
+}
+
+# Source columns for 'Taxable Value', in priority order (lowercase)
+TAXABLE_VALUE_SOURCES = ('value', 'purchase gst', 'purchase igst')
+
+# Fixed headers that are expected in the output (case-sensitive)
+FIXED_HEADERS = [
+    'GSTIN/UIN of Supplier',
+    'Supplier Name',
+    'Branch',
+    'Supplier Invoice Number',
+    'Invoice Date',  # Transaction Date
+    'Supplier Invoice Date',  # Actual Supplier Bill Date
+    'Invoice Type',
+    'Voucher Number',
+    'Invoice Value',
+    'Taxable Value',
+    'Integrated Tax',
+    'Central Tax',
+    'State/UT Tax',
+    'Cess',
+    'Round Off'
+]
+FIXED_HEADERS_LOWER = {h.lower() for h in FIXED_HEADERS}
+
+# Summary sheet columns. Interned so the dict keys and membership checks below hit the identity fast path.
+SUMMARY_HEADERS = tuple(sys.intern(h) for h in ('Month', 'No. of Records', 'Invoice Value', 'Taxable Value',
+                                                 'Integrated Tax', 'Central Tax', 'State/UT Tax', 'Cess'))
+SUMMARY_SUM_FIELDS = SUMMARY_HEADERS[2:]  # Columns summed per month
+TOTAL_LABEL = sys.intern('Total')
+
 # Number format for Indian numbering system
 INDIAN_NUMBER_FORMAT = r"[>=10000000]##\,##\,##\,##0.00;[>=100000]##\,##\,##0.00;##,##0.00;-;"
 
+# openpyxl's default cell format; it carries no Dr/Cr marker
+GENERAL_NUMBER_FORMAT = 'General'
+
+# Named styles for Total-row cells, registered once per workbook and stored once in styles.xml
+TOTAL_NUMBER_STYLE = 'indian_total'  # Bold red + INDIAN_NUMBER_FORMAT
+TOTAL_TEXT_STYLE = 'bold_red_text'  # Bold red, no number format
+
+# How many rows from the top are searched for the 'Date' header row
+HEADER_SEARCH_ROWS = 200
+
+# Sort sentinel for records without a usable date
+MIN_DATETIME = datetime.datetime.min
+
+# Financial-year month slot (April is 0) for each calendar month, indexed by date.month
+FY_MONTH_SLOT = (None, 9, 10, 11, 0, 1, 2, 3, 4, 5, 6, 7, 8)
+
+# Shared style objects, built once instead of per cell
+TITLE_FONT = Font(bold=True, size=12)
+HEADER_FONT = Font(bold=True)
+HEADER_FILL = PatternFill(start_color="D9D9D9", end_color="D9D9D9", fill_type="solid")
+CENTER_ALIGNMENT = Alignment(horizontal="center", vertical="center")
+TOTAL_FONT = Font(bold=True, color="FF0000")
+
 
 def find_header_row(worksheet):
     logging.info("Searching for header row starting with 'Date'")
-    for row in worksheet.iter_rows():
-        if isinstance(row[0].value, str) and row[0].value.strip().lower() == "date":
-            logging.info(f"Found header row at row {row[0].row}")
-            return row[0].row
+    # Returns (row number, header row values) from one scan of the first rows, so read-only sheets
+    # aren't re-read from the top to fetch the header row; (None, None) if no header is found
+    for row_num, row_values in enumerate(worksheet.iter_rows(min_row=1, max_row=HEADER_SEARCH_ROWS, values_only=True), start=1):
+        first_value = row_values[0] if row_values else None
+        if isinstance(first_value, str) and first_value.strip().lower() == "date":
+            logging.info(f"Found header row at row {row_num}")
+            return row_num, row_values
     logging.warning(f"Header row not found in sheet: {worksheet.title}")
-    return None
+    return None, None
 
 
-def get_financial_year(date):
-    if date is None:
-        return None
-    if date.month >= 4:
-        return date.year
-    return date.year - 1
+def append_title_and_headers(ws, title_text, columns):
+    # Title and header rows go in as two appends of pre-styled cells; works for regular and write-only sheets
+    title_cell = WriteOnlyCell(ws, value=title_text)
+    title_cell.font = TITLE_FONT
+    title_cell.alignment = CENTER_ALIGNMENT
+    ws.append([title_cell])
+    header_cells = []
+    for col in columns:
+        header_cell = WriteOnlyCell(ws, value=col)
+        header_cell.font = HEADER_FONT
+        header_cell.fill = HEADER_FILL
+        header_cell.alignment = CENTER_ALIGNMENT
+        header_cells.append(header_cell)
+    ws.append(header_cells)
 
 
 def create_or_replace_sheet(wb, sheet_name, title_text, columns):
@@ -80,91 +170,237 @@ def create_or_replace_sheet(wb, sheet_name, title_text, columns):
         logging.info(f"Sheet {sheet_name} exists, removing it")
         del wb[sheet_name]
     ws = wb.create_sheet(sheet_name)
-    ws.merge_cells(start_row=1, start_column=1, end_row=1, end_column=len(columns))
-    cell = ws.cell(row=1, column=1)
-    cell.value = title_text
-    cell.font = Font(bold=True, size=12)
-    cell.alignment = Alignment(horizontal="center", vertical="center")
-    for idx, col in enumerate(columns, start=1):
-        header_cell = ws.cell(row=2, column=idx, value=col)
-        header_cell.font = Font(bold=True)
-        header_cell.fill = PatternFill(start_color="D9D9D9", end_color="D9D9D9", fill_type="solid")
-        header_cell.alignment = Alignment(horizontal="center", vertical="center")
+    append_title_and_headers(ws, title_text, columns)
+    ws.merge_cells(start_row=1, start_column=1, end_row=1, end_column=len(columns))  # After the appends: merged cells advance the append row
     ws.freeze_panes = "B3"
     return ws
 
 
-def apply_format_and_autofit(ws, columns, start_row=3, col_format_map=None):
-    logging.info(f"Applying formats and autofitting columns for sheet: {ws.title}")
-    for col_idx, col_name in enumerate(columns, start=1):
-        col_letter = get_column_letter(col_idx)
-        max_len = len(str(col_name))
-        if col_format_map and col_name in col_format_map:
-            for row in range(start_row, ws.max_row + 1):
-                cell = ws.cell(row=row, column=col_idx)
-                if isinstance(cell.value, (int, float)):
-                    cell.number_format = col_format_map[col_name]
-        for row in range(2, ws.max_row + 1):
-            cell_value = ws.cell(row=row, column=col_idx).value
-            if cell_value is not None:
-                max_len = max(max_len, len(str(cell_value)))
-        ws.column_dimensions[col_letter].width = max(15, max_len + 2)  # Added padding
-    logging.info("Finished applying formats and autofitting")
-
-
-def add_total_row(ws, columns, start_row, end_row):  # Removed INDIAN_NUMBER_FORMAT arg, use global
-    logging.info(f"Adding total row for sheet: {ws.title}, from row {start_row} to {end_row}")
-    total_row_data = ['Total'] + [''] * (len(columns) - 1)
-
-    for col_idx in range(1, len(columns) + 1):
-        if col_idx == 1:
-            continue
-        header_name = columns[col_idx - 1]  # Standardized header name
-        if header_name in EXCLUDE_FROM_TOTAL_HEADERS:
-            logging.debug(f"Excluding column '{header_name}' from total.")
+def create_write_only_sheet(wb, sheet_name, title_text, columns, col_widths):
+    # Write-only counterpart of create_or_replace_sheet. Widths, the title merge and freeze panes
+    # have to be in place before the first append, so col_widths (max content length per column) is required.
+    logging.info(f"Creating write-only sheet: {sheet_name}")
+    if sheet_name in wb.sheetnames:
+        del wb[sheet_name]
+    ws = wb.create_sheet(sheet_name)
+    set_column_widths(ws, col_widths)
+    ws.merged_cells.add(f"A1:{get_column_letter(len(columns))}1")
+    ws.freeze_panes = "B3"
+    append_title_and_headers(ws, title_text, columns)
+    return ws
+
+
+def set_column_widths(ws, col_widths):
+    # col_widths: max displayed content length per column, collected from the rows before or while writing
+    for col_idx, max_len in enumerate(col_widths, start=1):
+        ws.column_dimensions[get_column_letter(col_idx)].width = max(15, max_len + 2)  # Added padding
+
+
+def format_row(ws, row_vals, format_cols):
+    # format_cols: (column index, number format) pairs; numeric values there become formatted WriteOnlyCells
+    row_vals = list(row_vals)
+    for i, number_format in format_cols:
+        if isinstance(row_vals[i], (int, float)):
+            cell = WriteOnlyCell(ws, value=row_vals[i])
+            cell.number_format = number_format
+            row_vals[i] = cell
+    return row_vals
+
+
+def stream_rows(ws, rows, format_cols):
+    # Write-only sheets serialise each row as it is appended, so one styled cell per formatted
+    # column is reused for every row instead of building a WriteOnlyCell per numeric value.
+    styled_cells = []
+    for i, number_format in format_cols:
+        cell = WriteOnlyCell(ws)
+        cell.number_format = number_format
+        styled_cells.append((i, cell))
+    for row_vals in rows:
+        row_vals = list(row_vals)
+        for i, cell in styled_cells:
+            if isinstance(row_vals[i], (int, float)):
+                cell.value = row_vals[i]
+                row_vals[i] = cell
+        ws.append(row_vals)
+
+
+def detail_total_row(columns, rows):
+    # One pass over the row lists gives the Total row and the displayed width of every column
+    # (header, rows and Total row), so the written sheet never has to be read back
+    total_indices = [i for i in range(1, len(columns)) if columns[i] not in EXCLUDE_FROM_TOTAL_HEADERS]
+    totals = [0.0] * len(columns)
+    has_numeric_data = [False] * len(columns)
+    col_widths = [len(str(h)) for h in columns]
+    for row_vals in rows:
+        for i, value in enumerate(row_vals):
+            if value is not None and len(str(value)) > col_widths[i]:
+                col_widths[i] = len(str(value))
+        for i in total_indices:
+            value = row_vals[i]
+            if isinstance(value, (int, float)) and math.isfinite(value):
+                totals[i] += float(value)
+                has_numeric_data[i] = True
+    total_row_data = ['Total'] + [totals[i] if has_numeric_data[i] else '' for i in range(1, len(columns))]
+    for i, value in enumerate(total_row_data):
+        col_widths[i] = max(col_widths[i], len(str(value)))
+    return total_row_data, col_widths
+
+
+def register_total_styles(wb):
+    if TOTAL_NUMBER_STYLE not in wb.named_styles:
+        wb.add_named_style(NamedStyle(name=TOTAL_NUMBER_STYLE, font=TOTAL_FONT,
+                                      number_format=INDIAN_NUMBER_FORMAT))
+    if TOTAL_TEXT_STYLE not in wb.named_styles:
+        wb.add_named_style(NamedStyle(name=TOTAL_TEXT_STYLE, font=TOTAL_FONT))
+
+
+def indian_number_width(value):
+    # Displayed length of a number under INDIAN_NUMBER_FORMAT (last 3 digits, then groups of 2, 2 decimals)
+    int_digits = len(str(int(abs(value))))
+    separators = 0 if int_digits <= 3 else 1 + (int_digits - 4) // 2
+    return int_digits + separators + 3 + (1 if value < 0 else 0)
+
+
+def build_monthly_summary(data_rows):
+    # Pure aggregation step: groups rows by the month of their Supplier Invoice Date (financial-year order)
+    # and returns one [month, count, sums...] list per month; no workbook access.
+    months_order = ['April', 'May', 'June', 'July', 'August', 'September',
+                    'October', 'November', 'December', 'January', 'February', 'March']
+    # Twelve financial-year month slots (April is 0), each a ([sums] in SUMMARY_SUM_FIELDS order, unique invoice set)
+    # pair, so a row reaches its month with a single lookup
+    month_slots = [None] * 12
+
+    debug_enabled = logging.getLogger().isEnabledFor(logging.DEBUG)
+    for row in data_rows:
+        # Use Supplier Invoice Date for month grouping in summary
+        date_for_summary = row.get('Supplier Invoice Date')
+        if not isinstance(date_for_summary, datetime.datetime):  # Fallback
+            date_for_summary = row.get('Invoice Date')
+
+        inv_num_for_summary = str(row.get('Supplier Invoice Number', '')).strip()  # Key for uniqueness
+
+        if not isinstance(date_for_summary, datetime.datetime) or not inv_num_for_summary:
+            if debug_enabled:
+                logging.debug("Skipping summary row: no valid Supplier Invoice Date/Number or Transaction Date.")
             continue
 
-        total = 0
-        has_numeric_data = False
-        try:
-            for row in range(start_row, end_row + 1):
-                value = ws.cell(row=row, column=col_idx).value
-                if isinstance(value, (int, float)) and not (math.isnan(value) or math.isinf(value)):
-                    total += float(value)
-                    has_numeric_data = True
-                elif value is not None and str(value).strip() != '':
-                    logging.debug(f"Non-numeric value encountered in column '{header_name}' at row {row}: {value}")
-            if has_numeric_data:
-                total_row_data[col_idx - 1] = total
-        except Exception as e:
-            logging.error(f"Error totaling column '{header_name}': {e}")
-            total_row_data[col_idx - 1] = "Error"
-
-    row_num = end_row + 1
-    logging.debug(f"Writing total row at row {row_num}")
-    for col_idx, value in enumerate(total_row_data, start=1):
-        cell = ws.cell(row=row_num, column=col_idx, value=value)
-        cell.font = Font(bold=True, color="FF0000")
-        if isinstance(value, (int, float)):
-            cell.number_format = INDIAN_NUMBER_FORMAT  # Use global format
-    logging.info("Total row added successfully")
+        month_idx = FY_MONTH_SLOT[date_for_summary.month]  # April is 0
+        slot = month_slots[month_idx]
+        if slot is None:
+            slot = month_slots[month_idx] = ([0.0] * len(SUMMARY_SUM_FIELDS), set())
+        sums, invoices = slot
+        invoices.add(inv_num_for_summary)  # Counted once per month via len() below
+
+        for field_pos, field in enumerate(SUMMARY_SUM_FIELDS):
+            value = row.get(field, 0.0)
+            if isinstance(value, (int, float)):
+                value = float(value)
+                if value != value or value in (math.inf, -math.inf):  # NaN/Inf are sanitised to 0 here, once
+                    value = 0.0
+                sums[field_pos] += value
+            elif value is not None and str(value).strip() not in ['', '0', '0.0']:
+                logging.warning(
+                    f"Non-numeric value '{value}' for '{field}' in summary for invoice '{inv_num_for_summary}', treating as 0.")
+
+    summary_rows = []
+    for month_n_sum, slot in zip(months_order, month_slots):
+        if slot is not None:
+            sums, invoices = slot
+            summary_rows.append([month_n_sum, len(invoices)] + sums)
+    return summary_rows
+
+
+def write_summary_sheet(wb, sheet_name, title_text, columns, rows, col_format_map=None, start_row=3):
+    # Emits an already-aggregated summary (one list per row, first column is the label) plus its Total row.
+    # Totals and column widths are accumulated from `rows` as they are written, so nothing is read back.
+    # Formatted Total-row cells use the TOTAL_NUMBER_STYLE named style, i.e. INDIAN_NUMBER_FORMAT.
+    register_total_styles(wb)
+    col_format_map = col_format_map or {}
+    if wb.write_only:
+        return write_only_summary_sheet(wb, sheet_name, title_text, columns, rows, col_format_map)
+    ws = create_or_replace_sheet(wb, sheet_name, title_text, columns)
+    col_widths = [len(h) for h in columns]
+    width_fns = [indian_number_width if h in col_format_map else (lambda v: len(str(v))) for h in columns]
+
+    def track_widths(row_vals):
+        for i, v in enumerate(row_vals):
+            w = width_fns[i](v)
+            if w > col_widths[i]:
+                col_widths[i] = w
+
+    format_cols = [(i, col_format_map[h]) for i, h in enumerate(columns) if h in col_format_map]
+    total_row_vals = [TOTAL_LABEL] + [0.0] * (len(columns) - 1)
+    for row_vals in rows:
+        ws.append(format_row(ws, row_vals, format_cols))  # Month rows carry their number formats as written
+        track_widths(row_vals)
+        for i in range(1, len(columns)):
+            total_row_vals[i] += row_vals[i]  # Always finite, sanitised during aggregation
+
+    if rows:
+        ws.append(total_row_vals)
+        track_widths(total_row_vals)
+        total_row_num = start_row + len(rows)
+        # Iterate the row's existing cells directly rather than looking each one up with ws.cell()
+        for total_cell, val, col_name in zip(ws[total_row_num], total_row_vals, columns):
+            if isinstance(val, (int, float)) and col_name in col_format_map:
+                total_cell.style = TOTAL_NUMBER_STYLE
+            else:
+                total_cell.style = TOTAL_TEXT_STYLE
 
+    set_column_widths(ws, col_widths)
+    return ws
 
-def safe_float_conversion(value, header, cell=None):  # header is standardized
+
+def write_only_summary_sheet(wb, sheet_name, title_text, columns, rows, col_format_map):
+    # write_summary_sheet for write-only workbooks: totals and widths are settled before anything is appended
+    col_widths = [len(h) for h in columns]
+    total_row_vals = [TOTAL_LABEL] + [0.0] * (len(columns) - 1)
+    for row_vals in rows:
+        for i in range(1, len(columns)):
+            total_row_vals[i] += row_vals[i]  # Always finite, sanitised during aggregation
+    for row_vals in rows + ([total_row_vals] if rows else []):
+        for i, v in enumerate(row_vals):
+            w = indian_number_width(v) if columns[i] in col_format_map else len(str(v))
+            if w > col_widths[i]:
+                col_widths[i] = w
+
+    ws = create_write_only_sheet(wb, sheet_name, title_text, columns, col_widths)
+    format_cols = [(i, col_format_map[h]) for i, h in enumerate(columns) if h in col_format_map]
+    for row_vals in rows:
+        ws.append(format_row(ws, row_vals, format_cols))
+    if rows:
+        total_cells = []
+        for val, col_name in zip(total_row_vals, columns):
+            total_cell = WriteOnlyCell(ws, value=val)
+            if isinstance(val, (int, float)) and col_name in col_format_map:
+                total_cell.style = TOTAL_NUMBER_STYLE
+            else:
+                total_cell.style = TOTAL_TEXT_STYLE
+            total_cells.append(total_cell)
+        ws.append(total_cells)
+    return ws
+
+
+def excluded_numeric_conversion(value, header, cell=None):
+    # Headers excluded from the Cr/Dr logic ('Invoice Value', 'Taxable Value', tax columns, text columns)
     if value is None:
         return 0.0
-
-    if header in EXCLUDE_HEADERS_FROM_CRDR_CHECK:
-        try:
-            float_value = float(value) if str(value).strip() != '' and value is not None else 0.0
-            if isinstance(value,
-                          str) and value.strip() != '' and float_value == 0.0 and value.strip() != '0' and value.strip() != '0.0':
-                return value
-            return float_value
-        except (ValueError, TypeError):
-            logging.debug(f"Could not convert value to float for header '{header}' (standard conversion): {value}")
+    try:
+        float_value = float(value) if str(value).strip() != '' and value is not None else 0.0
+        if isinstance(value,
+                      str) and value.strip() != '' and float_value == 0.0 and value.strip() != '0' and value.strip() != '0.0':
             return value
+        return float_value
+    except (ValueError, TypeError):
+        logging.debug(f"Could not convert value to float for header '{header}' (standard conversion): {value}")
+        return value
 
+
+def crdr_text_value(value, header):
+    # Slow path of crdr_numeric_conversion for anything that is not already a float: ints, strings with
+    # Tally Cr/Dr suffixes and unparseable values (which become 0.0)
+    if value is None:
+        return 0.0
     numeric_value = 0.0
     try:
         numeric_value = float(value)
@@ -192,9 +428,18 @@ def safe_float_conversion(value, header, cell=None):  # header is standardized
         else:
             logging.debug(f"Unexpected value type for conversion for header '{header}': {type(value)}")
             numeric_value = 0.0
+    return numeric_value
 
-    if cell and cell.number_format and isinstance(numeric_value, (int, float)):
-        format_str = str(cell.number_format)
+
+def crdr_numeric_conversion(value, header, cell=None):
+    # Default numeric conversion with Tally Cr/Dr suffixes and cell formats (e.g. 'Round Off', numeric extra headers)
+    # Numeric cells arrive as floats and skip straight to the format check.
+    numeric_value = value if type(value) is float else crdr_text_value(value, header)
+
+    # The default 'General' format carries neither marker, so it needs no substring tests
+    number_format = cell.number_format if cell else None
+    if number_format and number_format != GENERAL_NUMBER_FORMAT:
+        format_str = str(number_format)
         if 'Dr' in format_str and numeric_value < 0:  # Purchase: Dr format but negative value -> make positive
             numeric_value = abs(numeric_value)
         elif 'Cr' in format_str and numeric_value > 0:  # Purchase: Cr format but positive value -> make negative
@@ -202,275 +447,309 @@ def safe_float_conversion(value, header, cell=None):  # header is standardized
     return numeric_value
 
 
-def process_purchase_data(input_files, template_file=None, existing_wb=None):
-    logging.info(f"Starting purchase processing with {len(input_files)} input files")
-    all_data = []
-
-    source_key_to_standard_header = {
-        'gstin/uin': 'GSTIN/UIN of Supplier',
-        'particulars': 'Supplier Name',
-        'supplier invoice no.': 'Supplier Invoice Number',
-        'supplier invoice no': 'Supplier Invoice Number',
-        'date': 'Invoice Date',  # This is the transaction date from Tally
-        'supplier invoice date': 'Supplier Invoice Date',  # Actual invoice date from supplier
-        'voucher type': 'Invoice Type',
-        'voucher no.': 'Voucher Number',
-        'voucher no': 'Voucher Number',
-        'gross total': 'Invoice Value',  # Tally's Gross Total
-        'invoice value': 'Invoice Value',  # Alternative common name
-        'igst': 'Integrated Tax',
-        'cgst': 'Central Tax',
-        'sgst': 'State/UT Tax',
-        'cess': 'Cess',
-        'round off': 'Round Off',
-        'voucher ref. no': 'Voucher Ref. No',
-        'voucher ref. no.': 'Voucher Ref. No',
-        # 'value', 'purchase gst', 'purchase igst' are handled for 'Taxable Value'
-    }
+@lru_cache(maxsize=4096)
+def format_date(date):
+    # Display form of a parsed date; the same few hundred dates repeat, so strings are cached too
+    return date.strftime('%d-%m-%Y')
 
-    fixed_headers = [
-        'GSTIN/UIN of Supplier',
-        'Supplier Name',
-        'Branch',
-        'Supplier Invoice Number',
-        'Invoice Date',  # Transaction Date
-        'Supplier Invoice Date',  # Actual Supplier Bill Date
-        'Invoice Type',
-        'Voucher Number',
-        'Invoice Value',
-        'Taxable Value',
-        'Integrated Tax',
-        'Central Tax',
-        'State/UT Tax',
-        'Cess',
-        'Round Off'
-    ]
-    fixed_headers_lower = {h.lower() for h in fixed_headers}
-    extra_headers_set = set()
 
-    logging.info("Starting file processing loop for purchase data")
-    for filepath, branch_key in input_files:
-        logging.info(f"Processing file: {filepath} with branch_key: {branch_key}")
+@lru_cache(maxsize=4096)
+def parse_date_string(text):
+    # Accepts '%Y-%m-%d %H:%M:%S' or a Tally '%d-%m-%Y' first word; None when neither matches.
+    # Registers repeat the same few hundred dates, so parsed results are cached, and the
+    # fixed-width layouts are sliced directly before falling back to strptime.
+    if len(text) == 19 and text[4] == '-' and text[7] == '-' and text[10] == ' ' and text[13] == ':' and text[16] == ':':
         try:
-            wb = load_workbook(filepath, data_only=True)  # data_only=True for values
-            logging.info(f"Loaded workbook: {filepath}")
+            return datetime.datetime.fromisoformat(text)  # Same result as '%Y-%m-%d %H:%M:%S' for this shape
+        except ValueError:
+            pass
+    try:
+        return datetime.datetime.strptime(text, '%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        pass
+    parts = text.split()
+    if not parts:
+        return None
+    day_text = parts[0]
+    if (len(day_text) == 10 and day_text.isascii() and day_text[2] == '-' and day_text[5] == '-'
+            and day_text[:2].isdigit() and day_text[3:5].isdigit() and day_text[6:].isdigit()):
+        try:
+            return datetime.datetime(int(day_text[6:]), int(day_text[3:5]), int(day_text[:2]))
+        except ValueError:
+            return None
+    try:
+        return datetime.datetime.strptime(day_text, '%d-%m-%Y')  # Tally format
+    except ValueError:
+        return None
 
-            if len(wb.sheetnames) > 1:
-                if "Purchase Register" in wb.sheetnames:
-                    ws = wb["Purchase Register"]
-                else:
-                    logging.error(f"'Purchase Register' sheet not found in {filepath}")
-                    messagebox.showerror("Sheet Not Found",
-                                         f"'Purchase Register' sheet not found in {os.path.basename(filepath)}.")
-                    continue
-            else:
-                ws = wb.active
-                if not ws:
-                    logging.error(f"No active sheet in {filepath}")
-                    messagebox.showerror("Sheet Not Found", f"No active sheet found in {os.path.basename(filepath)}.")
-                    continue
 
-            header_row_num = find_header_row(ws)
-            if not header_row_num:
-                logging.error(f"Header row not found in {filepath}")
-                messagebox.showerror("Header Not Found", f"Header row not found in {os.path.basename(filepath)}.")
-                continue
+def supplier_invoice_date_conversion(value, header, cell=None):
+    # Supplier Invoice Date is parsed when it is a string; anything unparseable is kept as it is
+    sup_inv_date_val = value
+    if isinstance(sup_inv_date_val, str):
+        parsed_date = parse_date_string(sup_inv_date_val)
+        if parsed_date is None:
+            logging.warning(f"Could not parse Supplier Invoice Date '{sup_inv_date_val}', keeping as string.")
+        else:
+            sup_inv_date_val = parsed_date
+    elif not isinstance(sup_inv_date_val, datetime.datetime) and sup_inv_date_val is not None:
+        logging.warning(f"Supplier Invoice Date '{sup_inv_date_val}' is not a recognized date format, keeping as is.")
+    return sup_inv_date_val
+
+
+def converter_for_header(header):
+    # header is the standardized header name; the conversion branch depends only on it,
+    # so callers resolve the converter once per column instead of once per cell.
+    if header in EXCLUDE_HEADERS_FROM_CRDR_CHECK:
+        return excluded_numeric_conversion
+    return crdr_numeric_conversion
+
 
-            original_headers_from_sheet = [cell.value for cell in ws[header_row_num] if cell.value is not None]
-            original_headers_lower_map = {}  # Maps lowercase original header to its original casing
-            original_cells_lower_map = {}  # Maps lowercase original header to header cell object
-            for col_idx, header_val in enumerate(original_headers_from_sheet):
-                if header_val is not None:
-                    header_lower = str(header_val).lower()
-                    original_headers_lower_map[header_lower] = header_val
-                    original_cells_lower_map[header_lower] = ws.cell(row=header_row_num, column=col_idx + 1)
-
-            logging.debug(f"Original headers from '{filepath}': {original_headers_from_sheet}")
-
-            # Identify extra headers
-            for original_header_val in original_headers_from_sheet:
-                if original_header_val is not None:
-                    header_l = str(original_header_val).lower()
-                    is_mapped = header_l in source_key_to_standard_header
-                    is_taxable_value_source = header_l in ['value', 'purchase gst', 'purchase igst']
-                    is_fixed = False
-                    if is_mapped:
-                        standard_h = source_key_to_standard_header[header_l]
-                        if standard_h.lower() in fixed_headers_lower: is_fixed = True
-                    elif header_l in fixed_headers_lower:
-                        is_fixed = True
-
-                    if not is_mapped and not is_taxable_value_source and not is_fixed:
-                        extra_headers_set.add(original_header_val)  # Add original casing
-
-            logging.debug(f"Current extra_headers_set (original case): {extra_headers_set}")
-
-            for row_idx, row_cells_tuple in enumerate(ws.iter_rows(min_row=header_row_num + 1),
-                                                      start=header_row_num + 1):
-                row_data_orig_values = {}  # Maps original header string to value for current row
-                current_row_cells_map = {}  # Maps original header string to cell object for current row
-                for i, cell_obj in enumerate(row_cells_tuple):
-                    if i < len(original_headers_from_sheet):
-                        header = original_headers_from_sheet[i]
-                        row_data_orig_values[header] = cell_obj.value
-                        current_row_cells_map[header] = cell_obj
-
-                # Get date value using case-insensitive lookup on original headers
-                date_val = None
-                original_date_header_key = None
-                if 'date' in original_headers_lower_map:  # Transaction date
-                    original_date_header_key = original_headers_lower_map['date']
-                    date_val = row_data_orig_values.get(original_date_header_key)
-
-                particulars_val = None
-                if 'particulars' in original_headers_lower_map:
-                    original_particulars_header_key = original_headers_lower_map['particulars']
-                    particulars_val = row_data_orig_values.get(original_particulars_header_key, '')
-
-                if not date_val or (isinstance(particulars_val, str) and 'grand total' in particulars_val.lower()):
+def safe_float_conversion(value, header, cell=None):  # header is standardized
+    return converter_for_header(header)(value, header, cell)
+
+
+def parse_purchase_file(filepath, branch_key):
+    # Parses one Purchase Register into (rows, extra headers, errors). rows are header -> value dicts
+    # carrying this file's extra headers only; errors are (title, message) pairs for the caller to show,
+    # so the function can run in a worker process. Rows read before a failure are kept.
+    logging.info(f"Processing file: {filepath} with branch_key: {branch_key}")
+    rows = []
+    extra_headers_set = set()
+    errors = []
+    wb = None
+    try:
+        # Read-only mode streams the sheet XML instead of building the full cell tree.
+        # Cells still expose number_format, which the per-cell Dr/Cr check relies on.
+        wb = load_workbook(filepath, read_only=True, data_only=True)  # data_only=True for values
+        logging.info(f"Loaded workbook: {filepath}")
+
+        if len(wb.sheetnames) > 1:
+            if "Purchase Register" in wb.sheetnames:
+                ws = wb["Purchase Register"]
+            else:
+                logging.error(f"'Purchase Register' sheet not found in {filepath}")
+                errors.append(("Sheet Not Found",
+                               f"'Purchase Register' sheet not found in {os.path.basename(filepath)}."))
+                return rows, extra_headers_set, errors
+        else:
+            ws = wb.active
+            if not ws:
+                logging.error(f"No active sheet in {filepath}")
+                errors.append(("Sheet Not Found", f"No active sheet found in {os.path.basename(filepath)}."))
+                return rows, extra_headers_set, errors
+
+        ws.reset_dimensions()  # Don't trust the stored dimension tag; read until the sheet actually ends
+
+        header_row_num, header_row_values = find_header_row(ws)
+        if not header_row_num:
+            logging.error(f"Header row not found in {filepath}")
+            errors.append(("Header Not Found", f"Header row not found in {os.path.basename(filepath)}."))
+            return rows, extra_headers_set, errors
+
+        original_headers_from_sheet = [value for value in header_row_values if value is not None]
+        original_headers_lower_map = {}  # Maps lowercase original header to its original casing
+        for header_val in original_headers_from_sheet:
+            original_headers_lower_map[str(header_val).lower()] = header_val
+
+        logging.debug(f"Original headers from '{filepath}': {original_headers_from_sheet}")
+
+        # Identify extra headers
+        for original_header_val in original_headers_from_sheet:
+            if original_header_val is not None:
+                header_l = str(original_header_val).lower()
+                is_mapped = header_l in SOURCE_KEY_TO_STANDARD_HEADER
+                is_taxable_value_source = header_l in TAXABLE_VALUE_SOURCES
+                is_fixed = False
+                if is_mapped:
+                    standard_h = SOURCE_KEY_TO_STANDARD_HEADER[header_l]
+                    if standard_h.lower() in FIXED_HEADERS_LOWER: is_fixed = True
+                elif header_l in FIXED_HEADERS_LOWER:
+                    is_fixed = True
+
+                if not is_mapped and not is_taxable_value_source and not is_fixed:
+                    extra_headers_set.add(original_header_val)  # Add original casing
+
+        logging.debug(f"Current extra_headers_set (original case): {extra_headers_set}")
+
+        # Resolve each header to its column index, standard name and converter once per file instead of per row.
+        # Repeated headers keep the last column and later columns win for a shared standard header,
+        # matching the old per-row dict build. Conversion depends only on the standardized header.
+        col_idx_for = {h: i for i, h in enumerate(original_headers_from_sheet)}
+        column_plan = []  # (column index, standard header, converter); None marks the transaction date
+        for original_header, ci in col_idx_for.items():
+            header_lower = str(original_header).lower()
+            if header_lower in TAXABLE_VALUE_SOURCES:  # Handled separately below
+                continue
+            if header_lower in SOURCE_KEY_TO_STANDARD_HEADER:
+                standard_header = SOURCE_KEY_TO_STANDARD_HEADER[header_lower]
+            elif header_lower in FIXED_HEADERS_LOWER or original_header in extra_headers_set:
+                standard_header = original_header  # Use original casing
+            else:
+                continue
+            if standard_header == 'Invoice Date':  # Transaction Date, parsed below
+                convert = None
+            elif standard_header == 'Supplier Invoice Date':
+                convert = supplier_invoice_date_conversion
+            else:
+                convert = converter_for_header(standard_header)
+            column_plan.append((ci, standard_header, convert))
+        # Taxable Value source columns in priority order (Value -> PURCHASE GST -> PURCHASE IGST)
+        taxable_value_sources = [(col_idx_for[original_headers_lower_map[key]], original_headers_lower_map[key])
+                                 for key in TAXABLE_VALUE_SOURCES if key in original_headers_lower_map]
+        convert_taxable_value = converter_for_header('Taxable Value')
+        date_ci = col_idx_for.get(original_headers_lower_map.get('date'))
+        # Fixed headers the file does not supply stay ''; every extra header of this file is in column_plan
+        row_template = dict.fromkeys(FIXED_HEADERS, '')
+        row_template['Branch'] = branch_key
+        particulars_ci = col_idx_for.get(original_headers_lower_map.get('particulars'))
+
+        debug_enabled = logging.getLogger().isEnabledFor(logging.DEBUG)  # Row-level messages are only formatted when shown
+        # max_col pads rows whose trailing cells are absent, so every header still gets a (None) value
+        for row_idx, row_cells_tuple in enumerate(ws.iter_rows(min_row=header_row_num + 1,
+                                                               max_col=len(original_headers_from_sheet) or None),
+                                                  start=header_row_num + 1):
+            date_val = row_cells_tuple[date_ci].value if date_ci is not None else None
+            particulars_val = row_cells_tuple[particulars_ci].value if particulars_ci is not None else None
+
+            if not date_val or (isinstance(particulars_val, str) and 'grand total' in particulars_val.lower()):
+                if debug_enabled:
                     logging.debug(f"Skipping row {row_idx}: no Date or contains 'Grand Total'")
-                    continue
+                continue
 
-                # Convert transaction date
-                if isinstance(date_val, str):
-                    try:
-                        date_val = datetime.datetime.strptime(date_val, '%Y-%m-%d %H:%M:%S')
-                    except ValueError:
-                        try:
-                            date_val = datetime.datetime.strptime(date_val.split()[0], '%d-%m-%Y')  # Tally format
-                        except ValueError:
-                            logging.debug(f"Skipping row {row_idx} due to transaction date parsing error: {date_val}")
-                            continue
-                elif not isinstance(date_val, datetime.datetime):
-                    logging.debug(f"Skipping row {row_idx} due to invalid transaction date type: {type(date_val)}")
+            # Convert transaction date
+            if isinstance(date_val, str):
+                parsed_date = parse_date_string(date_val)
+                if parsed_date is None:
+                    if debug_enabled:
+                        logging.debug(f"Skipping row {row_idx} due to transaction date parsing error: {date_val}")
                     continue
-                if original_date_header_key: row_data_orig_values[original_date_header_key] = date_val
-
-                processed_row_data = {}
-                processed_row_data['Branch'] = branch_key
-
-                # Process each original header from the sheet for the current row
-                for original_header, original_value in row_data_orig_values.items():
-                    if original_header is None: continue
-                    header_lower = str(original_header).lower()
-                    cell = current_row_cells_map.get(original_header)
-
-                    # Skip Taxable Value source columns here; they are handled separately
-                    if header_lower in ['value', 'purchase gst', 'purchase igst']:
-                        continue
-
-                    standard_header = None
-                    if header_lower in source_key_to_standard_header:
-                        standard_header = source_key_to_standard_header[header_lower]
-                    elif header_lower in fixed_headers_lower:  # e.g. "Branch" if it was in source
-                        standard_header = original_header  # Use original casing
-                    elif original_header in extra_headers_set:
-                        standard_header = original_header  # Use original casing
-
-                    if standard_header:
-                        if standard_header == 'Invoice Date':  # Transaction Date
-                            processed_row_data[standard_header] = date_val
-                        # Special handling for Supplier Invoice Date if it's different from transaction date
-                        elif standard_header == 'Supplier Invoice Date':
-                            sup_inv_date_val = original_value
-                            if isinstance(sup_inv_date_val, str):
-                                try:
-                                    sup_inv_date_val = datetime.datetime.strptime(sup_inv_date_val, '%Y-%m-%d %H:%M:%S')
-                                except ValueError:
-                                    try:
-                                        sup_inv_date_val = datetime.datetime.strptime(sup_inv_date_val.split()[0],
-                                                                                      '%d-%m-%Y')
-                                    except ValueError:
-                                        logging.warning(
-                                            f"Could not parse Supplier Invoice Date '{sup_inv_date_val}', keeping as string.")
-                            elif not isinstance(sup_inv_date_val, datetime.datetime) and sup_inv_date_val is not None:
-                                logging.warning(
-                                    f"Supplier Invoice Date '{sup_inv_date_val}' is not a recognized date format, keeping as is.")
-                            processed_row_data[standard_header] = sup_inv_date_val
-                        else:
-                            processed_row_data[standard_header] = safe_float_conversion(original_value, standard_header,
-                                                                                        cell)
-
-                # Taxable Value Extraction Logic (Priority: Value -> PURCHASE GST -> PURCHASE IGST)
-                taxable_value_source_val = None
-                taxable_value_source_cell = None
-
-                tv_keys_priority = ['value', 'purchase gst', 'purchase igst']
-                for tv_key_lower in tv_keys_priority:
-                    if tv_key_lower in original_headers_lower_map:
-                        original_tv_header = original_headers_lower_map[tv_key_lower]
-                        val_from_source = row_data_orig_values.get(original_tv_header)
-                        cell_from_source = current_row_cells_map.get(original_tv_header)
-                        converted_val = safe_float_conversion(val_from_source, 'Taxable Value',
-                                                              cell_from_source)  # Check with 'Taxable Value' as target
-                        if (isinstance(converted_val, (int, float)) and converted_val != 0) or \
-                                (isinstance(converted_val, str) and converted_val.strip() not in ['', '0', '0.0']):
-                            taxable_value_source_val = val_from_source
-                            taxable_value_source_cell = cell_from_source
-                            logging.debug(f"Using '{original_tv_header}' for Taxable Value: {taxable_value_source_val}")
-                            break  # Found a non-zero source
-
-                processed_row_data['Taxable Value'] = safe_float_conversion(taxable_value_source_val, 'Taxable Value',
-                                                                            taxable_value_source_cell)
-
-                for header in fixed_headers:
-                    if header not in processed_row_data:
-                        processed_row_data[header] = ''
-                for eh_header in extra_headers_set:
-                    if eh_header not in processed_row_data:  # If extra header wasn't in this row's source
-                        original_eh_value = row_data_orig_values.get(eh_header)
-                        if original_eh_value is not None:
-                            cell_for_eh = current_row_cells_map.get(eh_header)
-                            processed_row_data[eh_header] = safe_float_conversion(original_eh_value, eh_header,
-                                                                                  cell_for_eh)
-                        else:
-                            processed_row_data[eh_header] = ''
-
-                all_data.append(processed_row_data)
-                logging.debug(f"Processed row {row_idx} and added to all_data")
-
-        except Exception as e:
-            logging.error(f"Error processing file {filepath}: {e}", exc_info=True)
-            messagebox.showerror("File Processing Error", f"Error processing file {os.path.basename(filepath)}: {e}")
-        logging.info(f"Finished processing file: {filepath}")
+                date_val = parsed_date
+            elif not isinstance(date_val, datetime.datetime):
+                if debug_enabled:
+                    logging.debug(f"Skipping row {row_idx} due to invalid transaction date type: {type(date_val)}")
+                continue
+
+            processed_row_data = row_template.copy()
+            for ci, standard_header, convert in column_plan:
+                if convert is None:
+                    processed_row_data[standard_header] = date_val
+                else:
+                    cell = row_cells_tuple[ci]
+                    processed_row_data[standard_header] = convert(cell.value, standard_header, cell)
+
+            # Taxable Value Extraction Logic: first source column whose value is non-zero
+            taxable_value_source_val = None
+            taxable_value_source_cell = None
+            for ci, original_tv_header in taxable_value_sources:
+                cell_from_source = row_cells_tuple[ci]
+                val_from_source = cell_from_source.value
+                converted_val = convert_taxable_value(val_from_source, 'Taxable Value',
+                                                      cell_from_source)  # Check with 'Taxable Value' as target
+                if (isinstance(converted_val, (int, float)) and converted_val != 0) or \
+                        (isinstance(converted_val, str) and converted_val.strip() not in ['', '0', '0.0']):
+                    taxable_value_source_val = val_from_source
+                    taxable_value_source_cell = cell_from_source
+                    if debug_enabled:
+                        logging.debug(f"Using '{original_tv_header}' for Taxable Value: {taxable_value_source_val}")
+                    break  # Found a non-zero source
+
+            processed_row_data['Taxable Value'] = convert_taxable_value(taxable_value_source_val, 'Taxable Value',
+                                                                        taxable_value_source_cell)
+
+            rows.append(processed_row_data)
+            if debug_enabled:
+                logging.debug(f"Processed row {row_idx} and added to rows")
+
+    except Exception as e:
+        logging.error(f"Error processing file {filepath}: {e}", exc_info=True)
+        errors.append(("File Processing Error", f"Error processing file {os.path.basename(filepath)}: {e}"))
+    finally:
+        if wb is not None:
+            wb.close()  # Read-only workbooks keep the source archive open until closed
+    logging.info(f"Finished processing file: {filepath}")
+    return rows, extra_headers_set, errors
+
+
+def parse_purchase_files(input_files, parallel=False):
+    # Registers are parsed independently, so with parallel=True several files are spread over worker processes.
+    # Opt-in only: spawned workers re-import the entry script as __mp_main__, and the app's entry point
+    # (gst_landing_ui) updates the module files and imports every UI at import time. Frozen builds
+    # re-enter the app entry point in spawned workers, so they always stay in-process.
+    if parallel and len(input_files) > 1 and not getattr(sys, 'frozen', False):
+        try:
+            with ProcessPoolExecutor(max_workers=min(len(input_files), os.cpu_count() or 1)) as executor:
+                return list(executor.map(parse_purchase_file, *zip(*input_files)))
+        except (OSError, BrokenProcessPool) as e:
+            logging.warning(f"Parallel parsing unavailable ({e}), parsing purchase files one by one")
+    return [parse_purchase_file(filepath, branch_key) for filepath, branch_key in input_files]
+
+
+def process_purchase_data(input_files, template_file=None, existing_wb=None, parallel=False):
+    # Returns (workbook, errors); errors are the per-file (title, message) pairs for the caller to show
+    logging.info(f"Starting purchase processing with {len(input_files)} input files")
+    all_data = []
+    errors = []
+
+    extra_headers_set = set()
+
+    logging.info("Starting file processing loop for purchase data")
+    for file_rows, file_extra_headers, file_errors in parse_purchase_files(input_files, parallel):
+        all_data.extend(file_rows)
+        extra_headers_set.update(file_extra_headers)
+        errors.extend(file_errors)
 
     logging.info("Finished file processing loop for purchase data")
 
     extra_headers_list = sorted(list(extra_headers_set))
-    final_headers = fixed_headers + extra_headers_list
+    final_headers = FIXED_HEADERS + extra_headers_list
     logging.info(f"Final headers for purchase detail sheets: {final_headers}")
     logging.info(f"Identified unique extra headers (original case): {extra_headers_list}")
     logging.info(f"Total records processed across all files: {len(all_data)}")
 
     # Data Structuring and Sorting
-    data_by_type = {"PUR-Total": all_data}
 
-    def sort_key_pur_total(row):  # Sort by Supplier Invoice Date (actual bill date)
-        date = row.get('Supplier Invoice Date')  # Use Supplier Invoice Date for primary sort
-        if not isinstance(date, datetime.datetime):  # Fallback to Transaction Date if SID is bad
+    # Sort keys are computed once per record in a single pass, then only indices are sorted.
+    # Both orders use the Supplier Invoice Date (actual bill date), falling back to the Transaction Date.
+    # The supplier-wise order is sorted from the date order, so its ties keep the date order.
+    total_keys = []
+    sws_keys = []  # cash/cancelled/blank suppliers sort last
+    for row in all_data:
+        date = row.get('Supplier Invoice Date')
+        if not isinstance(date, datetime.datetime):
             date = row.get('Invoice Date')
+        inv_num_str = str(row.get('Supplier Invoice Number', ''))
+        supplier = str(row.get('Supplier Name', '')).lower()
         if isinstance(date, datetime.datetime):
-            fy = get_financial_year(date)
-            return (fy, date.month if date.month >= 4 else date.month + 12, date.day,
-                    str(row.get('Supplier Invoice Number', '')))
-        return (0, 0, 0, str(row.get('Supplier Invoice Number', '')))
-
+            month = date.month
+            total_keys.append((date.year - (month < 4), FY_MONTH_SLOT[month], date.day, inv_num_str))
+        else:
+            total_keys.append((0, 0, 0, inv_num_str))
+            date = MIN_DATETIME
+        sws_keys.append((1 if supplier in ('cash', '(cancelled )') or not supplier else 0, supplier, date, inv_num_str))
     logging.info("Sorting data for PUR-Total by Supplier Invoice Date (Financial Year)")
-    data_by_type["PUR-Total"].sort(key=sort_key_pur_total)
-
-    def sort_key_sws(row):  # Supplier Wise Sort
-        supplier = str(row.get('Supplier Name', '')).lower()
-        # Use Supplier Invoice Date for sorting within supplier
-        date = row.get('Supplier Invoice Date')
-        if not isinstance(date, datetime.datetime): date = row.get('Invoice Date')  # Fallback
-        if not isinstance(date, datetime.datetime): date = datetime.datetime.min
-
-        if supplier in ['cash', '(cancelled )'] or not supplier:
-            return (1, supplier, date, str(row.get('Supplier Invoice Number', '')))
-        return (0, supplier, date, str(row.get('Supplier Invoice Number', '')))
-
+    total_order = sorted(range(len(all_data)), key=total_keys.__getitem__)
     logging.info("Sorting data for PUR-Total_sws by Supplier Name and Supplier Invoice Date")
-    data_by_type["PUR-Total_sws"] = sorted(all_data, key=sort_key_sws)
+    sws_order = sorted(total_order, key=sws_keys.__getitem__)
+    # Each record becomes its detail-sheet row once; both sheets take the same row lists in their own order
+    date_header_indices = [i for i, h in enumerate(final_headers) if h in ('Invoice Date', 'Supplier Invoice Date')]
+    # Records from files carrying every extra header have all final_headers keys and go through one
+    # C-level itemgetter call; the rest fall back to per-header .get with '' for missing columns
+    values_in_final_order = itemgetter(*final_headers)
+    record_rows = []
+    for row_data in all_data:
+        try:
+            row_values = list(values_in_final_order(row_data))
+        except KeyError:
+            row_values = [row_data.get(header, '') for header in final_headers]
+        for i in date_header_indices:
+            if isinstance(row_values[i], datetime.datetime):
+                row_values[i] = format_date(row_values[i])
+        record_rows.append(row_values)
+    rows_by_sheet = {"PUR-Total": [record_rows[i] for i in total_order],
+                     "PUR-Total_sws": [record_rows[i] for i in sws_order]}
+    all_data[:] = [all_data[i] for i in total_order]  # The summary sums the records in date order
+    del total_keys, sws_keys, record_rows
 
     # Workbook Creation
     if existing_wb is not None:
@@ -478,8 +757,8 @@ def process_purchase_data(input_files, template_file=None, existing_wb=None):
     elif template_file:
         output_wb = load_workbook(template_file)
     else:
-        output_wb = Workbook()
-        if 'Sheet' in output_wb.sheetnames and len(output_wb.sheetnames) == 1: del output_wb['Sheet']
+        output_wb = Workbook(write_only=True)  # Nothing is read back from a fresh workbook, so stream it
+    write_only = output_wb.write_only
 
     col_format_map = {
         'Invoice Date': 'DD-MM-YYYY',
@@ -496,29 +775,36 @@ def process_purchase_data(input_files, template_file=None, existing_wb=None):
         if eh not in col_format_map: col_format_map[eh] = INDIAN_NUMBER_FORMAT
 
     sheets_to_create = [
-        ("PUR-Total", data_by_type.get("PUR-Total", [])),
-        ("PUR-Total_sws", data_by_type.get("PUR-Total_sws", [])),
+        ("PUR-Total", rows_by_sheet["PUR-Total"]),
+        ("PUR-Total_sws", rows_by_sheet["PUR-Total_sws"]),
     ]
 
-    for sheet_name, data in sheets_to_create:
-        if not data:  # Skip empty sheets
+    for sheet_name, sheet_rows in sheets_to_create:
+        if not sheet_rows:  # Skip empty sheets
             logging.info(f"No data for sheet: {sheet_name}, skipping creation.")
             continue
-        logging.info(f"Processing sheet: {sheet_name} with {len(data)} records")
-        title = next(t for n, t in SECTION_TITLES if n == sheet_name)
-        ws = create_or_replace_sheet(output_wb, sheet_name, title, final_headers)
-        start_row_data = 3
-        for row_data in data:
-            row_values = []
-            for header in final_headers:  # Use final_headers for order and inclusion
-                value = row_data.get(header, '')
-                if header in ['Invoice Date', 'Supplier Invoice Date'] and isinstance(value, datetime.datetime):
-                    value = value.strftime('%d-%m-%Y')
-                row_values.append(value)
-            ws.append(row_values)
-        add_total_row(ws, final_headers, start_row_data, ws.max_row)
-        apply_format_and_autofit(ws, final_headers, col_format_map=col_format_map, start_row=start_row_data)
-        logging.info(f"Created sheet {sheet_name} with {len(data)} records")
+        logging.info(f"Processing sheet: {sheet_name} with {len(sheet_rows)} records")
+        title = SECTION_TITLE_MAP[sheet_name]
+        # Totals, widths and number formats all come from sheet_rows, so neither kind of sheet is read back
+        total_row_data, col_widths = detail_total_row(final_headers, sheet_rows)
+        format_cols = [(i, col_format_map[h]) for i, h in enumerate(final_headers) if h in col_format_map]
+        if write_only:
+            ws = create_write_only_sheet(output_wb, sheet_name, title, final_headers, col_widths)
+            stream_rows(ws, sheet_rows, format_cols)
+        else:
+            ws = create_or_replace_sheet(output_wb, sheet_name, title, final_headers)
+            for row_values in sheet_rows:
+                ws.append(format_row(ws, row_values, format_cols))
+            set_column_widths(ws, col_widths)
+        total_cells = []
+        for value, header in zip(total_row_data, final_headers):
+            total_cell = WriteOnlyCell(ws, value=value)
+            total_cell.font = TOTAL_FONT
+            if isinstance(value, (int, float)):
+                total_cell.number_format = col_format_map.get(header, INDIAN_NUMBER_FORMAT)
+            total_cells.append(total_cell)
+        ws.append(total_cells)
+        logging.info(f"Created sheet {sheet_name} with {len(sheet_rows)} records")
 
     # Summary Sheet Processing
     summary_sheet_name = "PUR-Summary-Total"
@@ -527,85 +813,16 @@ def process_purchase_data(input_files, template_file=None, existing_wb=None):
         logging.info(f"No data for summary sheet: {summary_sheet_name}, skipping creation.")
     else:
         logging.info(f"Processing summary sheet: {summary_sheet_name}")
-        summary_title = next(t for n, t in SECTION_TITLES if n == summary_sheet_name)
-        summary_headers = ['Month', 'No. of Records', 'Invoice Value', 'Taxable Value', 'Integrated Tax',
-                           'Central Tax', 'State/UT Tax', 'Cess']
-        summary_col_format_map = {h: INDIAN_NUMBER_FORMAT for h in summary_headers if
-                                  h not in ['Month', 'No. of Records']}
-
-        ws_summary = create_or_replace_sheet(output_wb, summary_sheet_name, summary_title, summary_headers)
-        monthly_summary_aggr = {}
-        unique_invoices_by_month = {}  # To count unique invoices per month
-        months_order = ['April', 'May', 'June', 'July', 'August', 'September',
-                        'October', 'November', 'December', 'January', 'February', 'March']
-
-        for row in summary_data_source:
-            # Use Supplier Invoice Date for month grouping in summary
-            date_for_summary = row.get('Supplier Invoice Date')
-            if not isinstance(date_for_summary, datetime.datetime):  # Fallback
-                date_for_summary = row.get('Invoice Date')
-
-            inv_num_for_summary = str(row.get('Supplier Invoice Number', '')).strip()  # Key for uniqueness
-
-            if not isinstance(date_for_summary, datetime.datetime) or not inv_num_for_summary:
-                logging.debug("Skipping summary row: no valid Supplier Invoice Date/Number or Transaction Date.")
-                continue
+        summary_title = SECTION_TITLE_MAP[summary_sheet_name]
+        summary_col_format_map = {h: INDIAN_NUMBER_FORMAT for h in SUMMARY_SUM_FIELDS}
 
-            month_idx = (date_for_summary.month - 4 + 12) % 12  # April is 0
-            month_name = months_order[month_idx]
-
-            if month_name not in monthly_summary_aggr:
-                monthly_summary_aggr[month_name] = {h: 0.0 for h in summary_headers if h not in ['Month']}
-                monthly_summary_aggr[month_name]['count'] = 0  # For 'No. of Records'
-                unique_invoices_by_month[month_name] = set()
-
-            if inv_num_for_summary not in unique_invoices_by_month[month_name]:
-                monthly_summary_aggr[month_name]['count'] += 1
-                unique_invoices_by_month[month_name].add(inv_num_for_summary)
-
-            fields_to_sum = ['Invoice Value', 'Taxable Value', 'Integrated Tax', 'Central Tax', 'State/UT Tax', 'Cess']
-            for field in fields_to_sum:
-                value = row.get(field, 0.0)
-                if isinstance(value, (int, float)) and not (math.isnan(value) or math.isinf(value)):
-                    monthly_summary_aggr[month_name][field] += float(value)
-                elif value is not None and str(value).strip() not in ['', '0', '0.0']:
-                    logging.warning(
-                        f"Non-numeric value '{value}' for '{field}' in summary for invoice '{inv_num_for_summary}', treating as 0.")
-
-        summary_start_row_data = 3
-        rows_added_summary = 0
-        for month_n_sum in months_order:
-            if month_n_sum in monthly_summary_aggr:
-                m_data = monthly_summary_aggr[month_n_sum]
-                ws_summary.append([
-                    month_n_sum, m_data['count'], m_data['Invoice Value'], m_data['Taxable Value'],
-                    m_data['Integrated Tax'], m_data['Central Tax'], m_data['State/UT Tax'], m_data['Cess']
-                ])
-                rows_added_summary += 1
-
-        if rows_added_summary > 0:
-            total_row_summary_vals = ['Total'] + [0.0] * (len(summary_headers) - 1)
-            for col_i_sum in range(1, len(summary_headers)):
-                curr_col_total_sum = 0.0
-                for r_i_sum in range(summary_start_row_data, summary_start_row_data + rows_added_summary):
-                    cell_val_sum = ws_summary.cell(row=r_i_sum, column=col_i_sum + 1).value
-                    if isinstance(cell_val_sum, (int, float)) and not (
-                            math.isnan(cell_val_sum) or math.isinf(cell_val_sum)):
-                        curr_col_total_sum += float(cell_val_sum)
-                total_row_summary_vals[col_i_sum] = curr_col_total_sum
-
-            ws_summary.append(total_row_summary_vals)
-            total_row_num_sum_sheet = summary_start_row_data + rows_added_summary
-            for c_idx_sum, val_sum in enumerate(total_row_summary_vals, start=1):
-                total_cell_sum = ws_summary.cell(row=total_row_num_sum_sheet, column=c_idx_sum)
-                total_cell_sum.font = Font(bold=True, color="FF0000")
-                if isinstance(val_sum, (int, float)) and summary_headers[c_idx_sum - 1] not in ['Month',
-                                                                                                'No. of Records']:
-                    total_cell_sum.number_format = INDIAN_NUMBER_FORMAT
-
-        apply_format_and_autofit(ws_summary, summary_headers, col_format_map=summary_col_format_map,
-                                 start_row=summary_start_row_data)
-        logging.info(f"Created summary sheet {summary_sheet_name}")
+        summary_rows = build_monthly_summary(summary_data_source)
+        if not summary_rows:  # No row had a usable date/invoice number; don't allocate an empty sheet
+            logging.info(f"Skipping empty summary sheet {summary_sheet_name}")
+        else:
+            write_summary_sheet(output_wb, summary_sheet_name, summary_title, SUMMARY_HEADERS, summary_rows,
+                                col_format_map=summary_col_format_map)
+            logging.info(f"Created summary sheet {summary_sheet_name}")
 
     logging.info("Purchase data processing completed")
-    return output_wb
+    return output_wb, errors
@@ -1,12 +1,17 @@
-import tkinter as tk # Kept for messagebox, consider removing if UI fully decouples
-from tkinter import messagebox # Used for error popups directly in processor
 from openpyxl import load_workbook, Workbook
 from openpyxl.styles import Font, Alignment, PatternFill
 from openpyxl.utils import get_column_letter
+from openpyxl.cell import WriteOnlyCell
 import datetime
 import os
 import logging
 import math
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import Counter
+from functools import lru_cache
+from operator import add, itemgetter
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -23,6 +28,7 @@ SECTION_TITLES = [
     ("SALE-Summary-B2C", "Sales Register - B2C only - Summary"),
     ("SALE-Summary-Others", "Sales Register - Others - Summary"),
 ]
+SECTION_TITLE_MAP = dict(SECTION_TITLES) # Sheet name -> display title
 
 # Define headers to exclude from total calculation (using standardized header names)
 EXCLUDE_FROM_TOTAL_HEADERS = [
@@ -56,24 +62,98 @@ INDIAN_NUMBER_FORMAT = r"[>=10000000]##\,##\,##\,##0.00;[>=100000]##\,##\,##0.00
 # Invoice Date is handled before this function.
 STRICTLY_TEXTUAL_HEADERS = ['GSTIN/UIN of Recipient', 'Receiver Name', 'Invoice Number', 'Invoice Type', 'Voucher Ref. No', 'Branch']
 
+# Mapping from lowercase source header keys to the standardized header names (case-sensitive)
+SOURCE_KEY_TO_STANDARD_HEADER = {
+    'gstin/uin': 'GSTIN/UIN of Recipient',
+    'particulars': 'Receiver Name',
+    'voucher no': 'Invoice Number', # Covers "Voucher No"
+    'voucher no.': 'Invoice Number',# Covers "Voucher No."
+    'date': 'Invoice Date',
+    'gross total': 'Invoice Value',
+    'voucher type': 'Invoice Type',
+    'value': 'Taxable Value', # Standard Tally export for taxable amount
+    'taxable amount': 'Taxable Value', # Common alternative
+    'igst': 'Integrated Tax',
+    'cgst': 'Central Tax',
+    'sgst': 'State/UT Tax',
+    'cess': 'Cess',
+    'round off': 'Round Off', # Covers "Round Off" and "ROUND OFF" due to lowercase key
+    'voucher ref. no': 'Voucher Ref. No',
+    'voucher ref. no.': 'Voucher Ref. No'
+}
+
+# Fixed headers that are expected in the output (case-sensitive)
+FIXED_HEADERS = [
+    'GSTIN/UIN of Recipient',
+    'Receiver Name',
+    'Branch',
+    'Invoice Number',
+    'Invoice Date',
+    'Invoice Type',
+    'Invoice Value',
+    'Taxable Value',
+    'Integrated Tax',
+    'Central Tax',
+    'State/UT Tax',
+    'Cess',
+    'Round Off'
+]
+FIXED_HEADERS_LOWER = {h.lower() for h in FIXED_HEADERS}
+
+# Sales sheet category for each Invoice Type; anything else goes to "Others"
+CATEGORY_FOR_INVOICE_TYPE = {"B2B": "B2B", "B2C": "B2C"}
+
+# How many rows from the top are searched for the 'Date' header row
+HEADER_SEARCH_ROWS = 200
+
+# Tally amount suffixes on string values
+CR_SUFFIX = ' Cr'
+DR_SUFFIX = ' Dr'
+CRDR_SUFFIX_LEN = 3
+GENERAL_NUMBER_FORMAT = 'General' # openpyxl's default cell format
+
+# Shared style objects, built once instead of per cell
+TITLE_FONT = Font(bold=True, size=12)
+HEADER_FONT = Font(bold=True)
+HEADER_FILL = PatternFill(start_color="D9D9D9", end_color="D9D9D9", fill_type="solid")
+CENTER_ALIGNMENT = Alignment(horizontal="center", vertical="center")
+TOTAL_FONT = Font(bold=True, color="FF0000")
+
+# Sort sentinel for records without a usable Invoice Date
+MIN_DATETIME = datetime.datetime.min
+
+# Financial-year month slot (April is 0) for each calendar month, indexed by date.month
+FY_MONTH_SLOT = (None, 9, 10, 11, 0, 1, 2, 3, 4, 5, 6, 7, 8)
+
 
 def find_header_row(worksheet):
     logging.debug(f"Searching for header row in sheet: {worksheet.title}")
-    for row in worksheet.iter_rows():
+    # Returns (row number, header row values) from one scan of the first rows, so read-only sheets
+    # aren't re-read from the top to fetch the header row; (None, None) if no header is found
+    for row_num, row_values in enumerate(worksheet.iter_rows(min_row=1, max_row=HEADER_SEARCH_ROWS, values_only=True), start=1):
+        first_value = row_values[0] if row_values else None
         # Case-insensitive check for 'Date' in the first cell
-        if isinstance(row[0].value, str) and row[0].value.strip().lower() == "date":
-            logging.debug(f"Header row found at row: {row[0].row}")
-            return row[0].row
+        if isinstance(first_value, str) and first_value.strip().lower() == "date":
+            logging.debug(f"Header row found at row: {row_num}")
+            return row_num, row_values
     logging.warning(f"Header row starting with 'Date' not found in sheet: {worksheet.title}")
-    return None
+    return None, None
 
 
-def get_financial_year(date):
-    if date is None:
-        return None
-    if date.month >= 4:
-        return date.year
-    return date.year - 1
+def append_title_and_headers(ws, title_text, columns):
+    # Title and header rows go in as two appends of pre-styled cells; works for regular and write-only sheets
+    title_cell = WriteOnlyCell(ws, value=title_text)
+    title_cell.font = TITLE_FONT
+    title_cell.alignment = CENTER_ALIGNMENT
+    ws.append([title_cell])
+    header_cells = []
+    for col in columns:
+        header_cell = WriteOnlyCell(ws, value=col)
+        header_cell.font = HEADER_FONT
+        header_cell.fill = HEADER_FILL
+        header_cell.alignment = CENTER_ALIGNMENT
+        header_cells.append(header_cell)
+    ws.append(header_cells)
 
 
 def create_or_replace_sheet(wb, sheet_name, title_text, columns):
@@ -82,134 +162,181 @@ def create_or_replace_sheet(wb, sheet_name, title_text, columns):
         logging.debug(f"Sheet '{sheet_name}' already exists, deleting.")
         del wb[sheet_name]
     ws = wb.create_sheet(sheet_name)
-    ws.merge_cells(start_row=1, start_column=1, end_row=1, end_column=len(columns))
-    cell = ws.cell(row=1, column=1)
-    cell.value = title_text
-    cell.font = Font(bold=True, size=12)
-    cell.alignment = Alignment(horizontal="center", vertical="center")
-    for idx, col in enumerate(columns, start=1):
-        header_cell = ws.cell(row=2, column=idx, value=col)
-        header_cell.font = Font(bold=True)
-        header_cell.fill = PatternFill(start_color="D9D9D9", end_color="D9D9D9", fill_type="solid")
-        header_cell.alignment = Alignment(horizontal="center", vertical="center")
+    append_title_and_headers(ws, title_text, columns)
+    ws.merge_cells(start_row=1, start_column=1, end_row=1, end_column=len(columns)) # After the appends: merged cells advance the append row
     ws.freeze_panes = "B3"
     logging.info(f"Finished creating sheet: {sheet_name}")
     return ws
 
 
-def apply_format_and_autofit(ws, columns, start_row=3, col_format_map=None):
-    logging.debug(f"Applying format and autofit for sheet: {ws.title}")
-    for col_idx, col_name in enumerate(columns, start=1):
-        col_letter = get_column_letter(col_idx)
-        max_len = len(str(col_name))
-        if col_format_map and col_name in col_format_map:
-            for row_num in range(start_row, ws.max_row + 1):
-                cell = ws.cell(row=row_num, column=col_idx)
-                if isinstance(cell.value, (int, float)):
-                    cell.number_format = col_format_map[col_name]
-        for row_num in range(2, ws.max_row + 1):
-            cell_value = ws.cell(row=row_num, column=col_idx).value
-            if cell_value is not None:
-                max_len = max(max_len, len(str(cell_value)))
-        ws.column_dimensions[col_letter].width = max(15, max_len + 2)
-    logging.debug(f"Finished applying format and autofit for sheet: {ws.title}")
-
-
-def add_total_row(ws, columns, start_row, end_row):
-    logging.debug(f"Adding total row for sheet: {ws.title}")
-    total_row_data = ['Total'] + [''] * (len(columns) - 1)
-
-    for col_idx in range(1, len(columns) + 1):
-        if col_idx == 1:
-            continue
+def total_row_cells(ws, total_row, total_formats):
+    # total_formats: number format per column for numeric totals (None leaves the cell unformatted),
+    # resolved once per sheet by the caller
+    total_cells = []
+    for value, number_format in zip(total_row, total_formats):
+        cell = WriteOnlyCell(ws, value=value)
+        cell.font = TOTAL_FONT
+        if number_format and isinstance(value, (int, float)):
+            cell.number_format = number_format
+        total_cells.append(cell)
+    return total_cells
+
+
+def rendered_widths(columns, rows):
+    # Longest str() of each column, header included; feeds set_column_widths
+    col_widths = [len(str(col)) for col in columns]
+    for row in rows:
+        for col_idx, value in enumerate(row):
+            if value is not None:
+                value_len = len(str(value))
+                if value_len > col_widths[col_idx]:
+                    col_widths[col_idx] = value_len
+    return col_widths
+
+
+def set_column_widths(ws, col_widths):
+    for col_idx, max_len in enumerate(col_widths, start=1):
+        ws.column_dimensions[get_column_letter(col_idx)].width = max(15, max_len + 2)
+
+
+def format_row(ws, row, format_cols):
+    # Numeric values in formatted columns are appended as WriteOnlyCells carrying their
+    # number format, so the sheet never has to be revisited to format them.
+    row = list(row)
+    for col_idx, number_format in format_cols:
+        value = row[col_idx]
+        if isinstance(value, (int, float)):
+            cell = WriteOnlyCell(ws, value=value)
+            cell.number_format = number_format
+            row[col_idx] = cell
+    return row
+
+
+def stream_rows(ws, rows, format_cols):
+    # Write-only sheets serialise each row as it is appended, so one styled cell per formatted
+    # column is reused for every row instead of building a WriteOnlyCell per numeric value.
+    styled_cells = []
+    for col_idx, number_format in format_cols:
+        cell = WriteOnlyCell(ws)
+        cell.number_format = number_format
+        styled_cells.append((col_idx, cell))
+    for row in rows:
+        row = list(row)
+        for col_idx, cell in styled_cells:
+            value = row[col_idx]
+            if isinstance(value, (int, float)):
+                cell.value = value
+                row[col_idx] = cell
+        ws.append(row)
+
+
+def write_only_sheet(wb, sheet_name, title_text, columns, rows, total_row, col_widths, col_format_map=None, total_number_format=INDIAN_NUMBER_FORMAT):
+    # Write-only sheets cannot be revisited, so widths, number formats and the total row
+    # are all settled before the rows are streamed out.
+    logging.info(f"Creating write-only sheet: {sheet_name}")
+    if sheet_name in wb.sheetnames:
+        del wb[sheet_name]
+    ws = wb.create_sheet(sheet_name)
+    col_formats = [col_format_map.get(col) if col_format_map else None for col in columns]
+    set_column_widths(ws, col_widths)
+    ws.merged_cells.add(f"A1:{get_column_letter(len(columns))}1")
+    ws.freeze_panes = "B3"
 
-        header_name = columns[col_idx - 1] # This is the standardized header name
-        if header_name in EXCLUDE_FROM_TOTAL_HEADERS:
-            logging.debug(f"Excluding column '{header_name}' from total.")
-            continue
+    append_title_and_headers(ws, title_text, columns)
 
-        total = 0
-        has_numeric_data = False
-        try:
-            for row in range(start_row, end_row + 1):
-                value = ws.cell(row=row, column=col_idx).value
-                if isinstance(value, (int, float)) and not (math.isnan(value) or math.isinf(value)):
-                    total += float(value)
-                    has_numeric_data = True
-                elif value is not None and str(value).strip() != '':
-                    logging.debug(f"Non-numeric value encountered in column '{header_name}' at row {row}: {value}")
-
-            if has_numeric_data:
-                total_row_data[col_idx - 1] = total
-        except Exception as e:
-            logging.error(f"Error totaling column '{header_name}': {e}")
-            total_row_data[col_idx - 1] = "Error"
-
-    row_num = end_row + 1
-    ws.append(total_row_data)
-    for col_idx, value in enumerate(total_row_data, start=1):
-        cell = ws.cell(row=row_num, column=col_idx)
-        cell.font = Font(bold=True, color="FF0000")
-        if isinstance(value, (int, float)):
-            cell.number_format = INDIAN_NUMBER_FORMAT # Use global Indian format for totals
-    logging.debug(f"Finished adding total row for sheet: {ws.title}")
+    format_cols = [(idx, fmt) for idx, fmt in enumerate(col_formats) if fmt]
+    stream_rows(ws, rows, format_cols)
 
+    # total_number_format covers numeric totals in unformatted columns
+    ws.append(total_row_cells(ws, total_row, [fmt or total_number_format for fmt in col_formats]))
+    logging.info(f"Finished write-only sheet: {sheet_name}")
+    return ws
 
-def safe_float_conversion(value, header, cell=None):
-    # header is the standardized header name
 
-    # Explicit handling for purely textual headers.
-    # If value is None or empty string, it becomes ''. Otherwise, it's str(value).
-    if header in STRICTLY_TEXTUAL_HEADERS:
-        if value is None:
-            return ''
-        val_str = str(value).strip()
-        return val_str # Return the stripped string (could be empty if original was spaces)
+@lru_cache(maxsize=4096)
+def format_date(date):
+    # Display form of a parsed date; the same few hundred dates repeat, so strings are cached too
+    return date.strftime('%d-%m-%Y')
+
+
+@lru_cache(maxsize=4096)
+def parse_date_string(text):
+    # Registers repeat the same few hundred dates, so parsed results are cached.
+    # Fixed-width layouts are sliced directly; anything else goes through strptime.
+    if len(text) == 19 and text[4] == '-' and text[7] == '-' and text[10] == ' ' and text[13] == ':' and text[16] == ':':
+        try: return datetime.datetime.fromisoformat(text) # Same result as '%Y-%m-%d %H:%M:%S' for this shape
+        except ValueError: pass
+    try: return datetime.datetime.strptime(text, '%Y-%m-%d %H:%M:%S')
+    except ValueError: pass
+    parts = text.split()
+    if not parts: return None
+    day_text = parts[0]
+    if len(day_text) == 10 and day_text.isascii() and day_text[2] == '-' and day_text[5] == '-' and day_text[:2].isdigit() and day_text[3:5].isdigit() and day_text[6:].isdigit():
+        try: return datetime.datetime(int(day_text[6:]), int(day_text[3:5]), int(day_text[:2]))
+        except ValueError: return None
+    try: return datetime.datetime.strptime(day_text, '%d-%m-%Y')
+    except ValueError: return None
+
+def text_conversion(value, header, cell=None):
+    # Purely textual headers: None becomes '', anything else its stripped string
+    if value is None:
+        return ''
+    return str(value).strip() # Could be empty if original was spaces
+
 
-    # For all other headers, if value is None, it should become 0.0 for numeric processing
+def excluded_numeric_conversion(value, header, cell=None):
+    # Headers excluded from Cr/Dr logic but possibly numeric (e.g. 'Invoice Value')
     if value is None:
         return 0.0
+    str_val_stripped = str(value).strip()
+    if not str_val_stripped: # If effectively empty after stripping (e.g., "", "  ")
+        return 0.0 # For numeric fields like 'Invoice Value', empty should be 0.0
+    try:
+        return float(value) # Try to convert to float
+    except (ValueError, TypeError):
+        # If it's a non-empty string that can't be float, return it as is.
+        logging.debug(f"Could not convert value to float for excluded header '{header}': {value}. Returning as string.")
+        return str_val_stripped # Return the original non-empty string
 
-    # Handling for headers excluded from Cr/Dr logic but might be numeric (e.g., 'Invoice Value')
-    # or other textual headers not in STRICTLY_TEXTUAL_HEADERS but in EXCLUDE_HEADERS_FROM_CRDR_CHECK
-    if header in EXCLUDE_HEADERS_FROM_CRDR_CHECK:
-        # This implies header is NOT in STRICTLY_TEXTUAL_HEADERS but IS in EXCLUDE_HEADERS_FROM_CRDR_CHECK
-        # Example: 'Invoice Value'
-        str_val_stripped = str(value).strip()
-        if not str_val_stripped: # If effectively empty after stripping (e.g., "", "  ")
-            return 0.0 # For numeric fields like 'Invoice Value', empty should be 0.0
-        try:
-            return float(value) # Try to convert to float
-        except (ValueError, TypeError):
-            # If it's a non-empty string that can't be float, return it as is.
-            logging.debug(f"Could not convert value to float for excluded header '{header}': {value}. Returning as string.")
-            return str_val_stripped # Return the original non-empty string
-
-    # Default numeric conversion for fields NOT in EXCLUDE_HEADERS_FROM_CRDR_CHECK
-    # (e.g., 'Taxable Value', 'Integrated Tax', 'Round Off', and other numeric extra headers)
+
+def crdr_text_value(value):
+    # Slow path of crdr_numeric_conversion for anything that is not already a float: ints, strings with
+    # Tally Cr/Dr suffixes and unparseable values (which become 0.0)
+    if value is None:
+        return 0.0
     numeric_value = 0.0
     try:
         numeric_value = float(value) # Directly try to convert to float
     except (ValueError, TypeError):
         if isinstance(value, str):
-            value_str = value.strip()
+            # float() ignores surrounding whitespace itself, so only trailing space has to go before the suffix check
+            value_str = value.rstrip() if value[-1:].isspace() else value
             if not value_str: # Empty string becomes 0.0
                 numeric_value = 0.0
-            elif value_str.endswith(' Cr'): # For Sales, Cr is positive
-                try: numeric_value = float(value_str[:-3])
+            elif value_str.endswith(CR_SUFFIX): # For Sales, Cr is positive
+                try: numeric_value = float(value_str[:-CRDR_SUFFIX_LEN])
                 except ValueError: numeric_value = 0.0
-            elif value_str.endswith(' Dr'): # For Sales, Dr is negative
-                try: numeric_value = -float(value_str[:-3])
+            elif value_str.endswith(DR_SUFFIX): # For Sales, Dr is negative
+                try: numeric_value = -float(value_str[:-CRDR_SUFFIX_LEN])
                 except ValueError: numeric_value = 0.0
-            else: # Try to convert string directly if no Cr/Dr
-                try: numeric_value = float(value_str)
-                except ValueError: numeric_value = 0.0 # If still not convertible
+            else: # Not convertible and no Cr/Dr suffix
+                numeric_value = 0.0
         else:
             numeric_value = 0.0 # Non-string, non-float types become 0.0
+    return numeric_value
+
+
+def crdr_numeric_conversion(value, header, cell=None):
+    # Default numeric conversion (e.g. 'Taxable Value', 'Integrated Tax', 'Round Off', numeric extra headers)
+    # Numeric cells arrive as floats and skip straight to the format check.
+    numeric_value = value if type(value) is float else crdr_text_value(value)
 
-    # Apply number format based logic (Dr/Cr in cell format)
-    if cell and cell.number_format and isinstance(numeric_value, (int, float)):
-        format_str = str(cell.number_format)
+    # Apply number format based logic (Dr/Cr in cell format). Formats are set per cell in the
+    # registers, so this stays a per-cell check rather than being decided once per column.
+    # The default 'General' format carries neither marker, so it needs no substring tests.
+    number_format = cell.number_format if cell else None
+    if number_format and number_format != GENERAL_NUMBER_FORMAT:
+        format_str = str(number_format)
         if 'Dr' in format_str and numeric_value > 0: # Sales: Dr format & positive value -> make negative
             numeric_value *= -1
         elif 'Cr' in format_str and numeric_value < 0: # Sales: Cr format & negative value -> make positive
@@ -217,211 +344,282 @@ def safe_float_conversion(value, header, cell=None):
     return numeric_value
 
 
-def process_excel_data(input_files, template_file=None, existing_wb=None):
-    logging.info("Starting sales data processing")
-    all_data = []
-
-    # Define the mapping from lowercase source header keys to the desired standardized header names (case-sensitive)
-    source_key_to_standard_header = {
-        'gstin/uin': 'GSTIN/UIN of Recipient',
-        'particulars': 'Receiver Name',
-        'voucher no': 'Invoice Number', # Covers "Voucher No"
-        'voucher no.': 'Invoice Number',# Covers "Voucher No."
-        'date': 'Invoice Date',
-        'gross total': 'Invoice Value',
-        'voucher type': 'Invoice Type',
-        'value': 'Taxable Value', # Standard Tally export for taxable amount
-        'taxable amount': 'Taxable Value', # Common alternative
-        'igst': 'Integrated Tax',
-        'cgst': 'Central Tax',
-        'sgst': 'State/UT Tax',
-        'cess': 'Cess',
-        'round off': 'Round Off', # Covers "Round Off" and "ROUND OFF" due to lowercase key
-        'voucher ref. no': 'Voucher Ref. No',
-        'voucher ref. no.': 'Voucher Ref. No'
-    }
+def converter_for_header(header):
+    # header is the standardized header name; the conversion branch depends only on it,
+    # so callers resolve the converter once per column instead of once per cell.
+    if header in STRICTLY_TEXTUAL_HEADERS:
+        return text_conversion
+    if header in EXCLUDE_HEADERS_FROM_CRDR_CHECK:
+        return excluded_numeric_conversion
+    return crdr_numeric_conversion
 
-    # Fixed headers that are expected in the output (case-sensitive)
-    fixed_headers = [
-        'GSTIN/UIN of Recipient',
-        'Receiver Name',
-        'Branch',
-        'Invoice Number',
-        'Invoice Date',
-        'Invoice Type',
-        'Invoice Value',
-        'Taxable Value',
-        'Integrated Tax',
-        'Central Tax',
-        'State/UT Tax',
-        'Cess',
-        'Round Off'
-    ]
-    fixed_headers_lower = {h.lower() for h in fixed_headers}
-    extra_headers_set = set() # To collect unique extra headers (stores original casing)
 
-    logging.debug("Starting file processing loop")
-    for filepath, branch_key in input_files:
-        logging.info(f"Processing sales file: {filepath} with branch_key: {branch_key}")
-        try:
-            wb = load_workbook(filepath, data_only=True)
-            if len(wb.sheetnames) > 1:
-                if "Sales Register" in wb.sheetnames:
-                    ws = wb["Sales Register"]
-                else:
-                    logging.error(f"'Sales Register' sheet not found in {filepath}")
-                    messagebox.showerror("Sheet Not Found", f"'Sales Register' sheet not found in {os.path.basename(filepath)}.\nPlease ensure the sheet name is correct.")
-                    continue # Skip this file
+def safe_float_conversion(value, header, cell=None):
+    return converter_for_header(header)(value, header, cell)
+
+
+def parse_sales_file(filepath, branch_key):
+    # Parses one register into (headers, rows, errors): headers are FIXED_HEADERS plus this file's
+    # extra headers, and each row is a list in that order. It is top-level so a process pool can
+    # pickle it, and it never opens dialogs; errors are (title, message) pairs for the caller.
+    file_headers = list(FIXED_HEADERS)
+    rows = []
+    extra_headers_set = set() # Unique extra headers of this file (stores original casing)
+    errors = []
+    logging.info(f"Processing sales file: {filepath} with branch_key: {branch_key}")
+    wb = None
+    try:
+        # Read-only mode streams the sheet XML instead of building the full cell tree.
+        # Cells still expose number_format, which the per-cell Dr/Cr check relies on.
+        wb = load_workbook(filepath, read_only=True, data_only=True)
+        if len(wb.sheetnames) > 1:
+            if "Sales Register" in wb.sheetnames:
+                ws = wb["Sales Register"]
             else:
-                ws = wb.active
-                if not ws:
-                    logging.error(f"No active sheet in {filepath}")
-                    messagebox.showerror("Sheet Not Found", f"No active sheet found in {os.path.basename(filepath)}.")
-                    continue # Skip this file
-
-            header_row_num = find_header_row(ws)
-            if not header_row_num:
-                logging.error(f"Header row not found in {filepath}")
-                messagebox.showerror("Header Not Found", f"Header row starting with 'Date' not found in {os.path.basename(filepath)}.")
-                continue # Skip this file
-
-            original_headers_from_sheet = [cell.value for cell in ws[header_row_num] if cell.value is not None]
-            original_headers_lower_map = {}
-            original_cells_lower_map = {}
-            for col_idx, header_val in enumerate(original_headers_from_sheet):
-                if header_val is not None:
-                    header_lower = str(header_val).lower()
-                    original_headers_lower_map[header_lower] = header_val
-                    original_cells_lower_map[header_lower] = ws.cell(row=header_row_num, column=col_idx + 1)
-
-            logging.debug(f"Original headers from '{filepath}': {original_headers_from_sheet}")
-
-            for original_header_val in original_headers_from_sheet:
-                if original_header_val is not None:
-                    header_l = str(original_header_val).lower()
-                    is_mapped = header_l in source_key_to_standard_header
-                    is_fixed = False
-                    if is_mapped:
-                        standard_h = source_key_to_standard_header[header_l]
-                        if standard_h.lower() in fixed_headers_lower:
-                            is_fixed = True
-                    elif header_l in fixed_headers_lower:
+                logging.error(f"'Sales Register' sheet not found in {filepath}")
+                errors.append(("Sheet Not Found", f"'Sales Register' sheet not found in {os.path.basename(filepath)}.\nPlease ensure the sheet name is correct."))
+                return file_headers, rows, errors
+        else:
+            ws = wb.active
+            if not ws:
+                logging.error(f"No active sheet in {filepath}")
+                errors.append(("Sheet Not Found", f"No active sheet found in {os.path.basename(filepath)}."))
+                return file_headers, rows, errors
+        ws.reset_dimensions() # Don't trust the stored dimension tag; read until the sheet actually ends
+
+        header_row_num, header_row_values = find_header_row(ws)
+        if not header_row_num:
+            logging.error(f"Header row not found in {filepath}")
+            errors.append(("Header Not Found", f"Header row starting with 'Date' not found in {os.path.basename(filepath)}."))
+            return file_headers, rows, errors
+
+        original_headers_from_sheet = [value for value in header_row_values if value is not None]
+        original_headers_lower_map = {}
+        for header_val in original_headers_from_sheet:
+            original_headers_lower_map[str(header_val).lower()] = header_val
+
+        logging.debug(f"Original headers from '{filepath}': {original_headers_from_sheet}")
+
+        for original_header_val in original_headers_from_sheet:
+            if original_header_val is not None:
+                header_l = str(original_header_val).lower()
+                is_mapped = header_l in SOURCE_KEY_TO_STANDARD_HEADER
+                is_fixed = False
+                if is_mapped:
+                    standard_h = SOURCE_KEY_TO_STANDARD_HEADER[header_l]
+                    if standard_h.lower() in FIXED_HEADERS_LOWER:
                         is_fixed = True
-                    if not is_mapped and not is_fixed:
-                        extra_headers_set.add(original_header_val)
-
-            logging.debug(f"Current extra_headers_set (original case): {extra_headers_set}")
-
-            for row_idx, row_cells_tuple in enumerate(ws.iter_rows(min_row=header_row_num + 1, values_only=False), start=header_row_num + 1):
-                row_data_orig_values = {}
-                current_row_cells_map = {}
-                for i, cell_obj in enumerate(row_cells_tuple):
-                    if i < len(original_headers_from_sheet):
-                        header = original_headers_from_sheet[i]
-                        row_data_orig_values[header] = cell_obj.value
-                        current_row_cells_map[header] = cell_obj
-
-                date_val = None
-                original_date_header_key = None
-                if 'date' in original_headers_lower_map:
-                    original_date_header_key = original_headers_lower_map['date']
-                    date_val = row_data_orig_values.get(original_date_header_key)
-
-                particulars_val = None
-                if 'particulars' in original_headers_lower_map:
-                    original_particulars_header_key = original_headers_lower_map['particulars']
-                    particulars_val = row_data_orig_values.get(original_particulars_header_key, '')
-
-                if not date_val or (isinstance(particulars_val, str) and 'grand total' in particulars_val.lower()):
-                    logging.debug(f"Skipping row {row_idx}: no Date or contains 'Grand Total'")
-                    continue
+                elif header_l in FIXED_HEADERS_LOWER:
+                    is_fixed = True
+                if not is_mapped and not is_fixed:
+                    extra_headers_set.add(original_header_val)
+
+        logging.debug(f"Current extra_headers_set (original case): {extra_headers_set}")
+
+        # Resolve each header to its column index and standard name once per file instead of per row.
+        # Repeated headers keep the last column, matching the old per-row dict build.
+        # Rows are plain lists laid out as file_headers; columns this file lacks stay ''.
+        file_headers = FIXED_HEADERS + list(extra_headers_set)
+        out_idx_for = {h: i for i, h in enumerate(file_headers)}
+        branch_out_idx = out_idx_for['Branch']
+        col_idx_for = {h: i for i, h in enumerate(original_headers_from_sheet) if h is not None}
+        column_plan = [] # (column index, output index, standard header, converter)
+        for original_header, ci in col_idx_for.items():
+            header_lower = str(original_header).lower()
+            if header_lower in SOURCE_KEY_TO_STANDARD_HEADER:
+                standard_header = SOURCE_KEY_TO_STANDARD_HEADER[header_lower]
+            elif header_lower in FIXED_HEADERS_LOWER or original_header in extra_headers_set:
+                standard_header = original_header
+            else:
+                continue
+            if standard_header in out_idx_for: # Differently-cased fixed headers never reach the output
+                column_plan.append((ci, out_idx_for[standard_header], standard_header, converter_for_header(standard_header)))
+        date_ci = col_idx_for.get(original_headers_lower_map.get('date'))
+        particulars_ci = col_idx_for.get(original_headers_lower_map.get('particulars'))
+
+        debug_enabled = logging.getLogger().isEnabledFor(logging.DEBUG) # Row-level messages are only formatted when shown
+        # max_col pads short rows with empty cells, so trailing blanks still count as present-but-empty
+        for row_idx, row_cells_tuple in enumerate(ws.iter_rows(min_row=header_row_num + 1, max_col=len(original_headers_from_sheet), values_only=False), start=header_row_num + 1):
+            date_val = row_cells_tuple[date_ci].value if date_ci is not None else None
+            particulars_val = row_cells_tuple[particulars_ci].value if particulars_ci is not None else None
+
+            if not date_val or (isinstance(particulars_val, str) and 'grand total' in particulars_val.lower()):
+                if debug_enabled: logging.debug(f"Skipping row {row_idx}: no Date or contains 'Grand Total'")
+                continue
 
-                if isinstance(date_val, str):
-                    try: date_val = datetime.datetime.strptime(date_val, '%Y-%m-%d %H:%M:%S')
-                    except ValueError:
-                        try: date_val = datetime.datetime.strptime(date_val.split()[0], '%d-%m-%Y')
-                        except ValueError:
-                            logging.debug(f"Skipping row {row_idx} due to date parsing error: {date_val}")
-                            continue
-                elif not isinstance(date_val, datetime.datetime):
-                    logging.debug(f"Skipping row {row_idx} due to invalid date type: {type(date_val)}")
+            if isinstance(date_val, str):
+                parsed_date = parse_date_string(date_val)
+                if parsed_date is None:
+                    if debug_enabled: logging.debug(f"Skipping row {row_idx} due to date parsing error: {date_val}")
                     continue
-                if original_date_header_key:
-                    row_data_orig_values[original_date_header_key] = date_val
-
-                processed_row_data = {}
-                processed_row_data['Branch'] = branch_key
-
-                for original_header, original_value in row_data_orig_values.items():
-                    if original_header is None: continue
-                    header_lower = str(original_header).lower()
-                    cell_for_conversion = current_row_cells_map.get(original_header)
-                    standard_header = None
-                    if header_lower in source_key_to_standard_header:
-                        standard_header = source_key_to_standard_header[header_lower]
-                    elif header_lower in fixed_headers_lower:
-                        standard_header = original_header
-                    elif original_header in extra_headers_set:
-                        standard_header = original_header
-
-                    if standard_header:
-                        if standard_header == 'Invoice Date':
-                             processed_row_data[standard_header] = date_val
-                        else:
-                             processed_row_data[standard_header] = safe_float_conversion(original_value, standard_header, cell_for_conversion)
-
-                for fh in fixed_headers:
-                    if fh not in processed_row_data:
-                        processed_row_data[fh] = ''
-                for eh in extra_headers_set:
-                    if eh not in processed_row_data:
-                        original_eh_value = row_data_orig_values.get(eh)
-                        if original_eh_value is not None:
-                             cell_for_eh_conversion = current_row_cells_map.get(eh)
-                             processed_row_data[eh] = safe_float_conversion(original_eh_value, eh, cell_for_eh_conversion)
-                        else:
-                             processed_row_data[eh] = ''
-                all_data.append(processed_row_data)
-        except Exception as e:
-            logging.error(f"Error processing file {filepath}: {e}", exc_info=True)
-            messagebox.showerror("File Processing Error", f"Error processing file {os.path.basename(filepath)}: {e}\n\nPlease check the logs for more details.")
-        logging.info(f"Finished processing sales file: {filepath}")
+                date_val = parsed_date
+            elif not isinstance(date_val, datetime.datetime):
+                if debug_enabled: logging.debug(f"Skipping row {row_idx} due to invalid date type: {type(date_val)}")
+                continue
+
+            row_values = [''] * len(file_headers)
+            row_values[branch_out_idx] = branch_key
+            for ci, out_idx, standard_header, convert in column_plan:
+                if standard_header == 'Invoice Date':
+                    row_values[out_idx] = date_val
+                else:
+                    cell_obj = row_cells_tuple[ci]
+                    row_values[out_idx] = convert(cell_obj.value, standard_header, cell_obj)
+            rows.append(row_values)
+    except Exception as e:
+        logging.error(f"Error processing file {filepath}: {e}", exc_info=True)
+        errors.append(("File Processing Error", f"Error processing file {os.path.basename(filepath)}: {e}\n\nPlease check the logs for more details."))
+    finally:
+        if wb is not None:
+            wb.close() # Read-only workbooks keep the source archive open until closed
+    logging.info(f"Finished processing sales file: {filepath}")
+    return file_headers, rows, errors
+
+
+def parse_sales_files(input_files, parallel=False):
+    # Registers are parsed independently, so with parallel=True several files are spread over worker processes.
+    # Opt-in only: spawned workers re-import the entry script as __mp_main__, and the app's entry point
+    # (gst_landing_ui) updates the module files and imports every UI at import time. Frozen builds
+    # re-enter the app entry point in spawned workers, so they always stay in-process.
+    if parallel and len(input_files) > 1 and not getattr(sys, 'frozen', False):
+        try:
+            with ProcessPoolExecutor(max_workers=min(len(input_files), os.cpu_count() or 1)) as executor:
+                return list(executor.map(parse_sales_file, *zip(*input_files)))
+        except (OSError, BrokenProcessPool) as e:
+            logging.warning(f"Parallel parsing unavailable ({e}), parsing sales files one by one")
+    return [parse_sales_file(filepath, branch_key) for filepath, branch_key in input_files]
+
+
+def process_excel_data(input_files, template_file=None, existing_wb=None, parallel=False):
+    # Returns (workbook, errors). errors are the per-file (title, message) pairs, in file order; showing
+    # them is left to the caller, so the processor can run off the Tk thread or without a UI at all.
+    logging.info("Starting sales data processing")
+    debug_enabled = logging.getLogger().isEnabledFor(logging.DEBUG) # Row-level messages are only formatted when shown
+
+    logging.debug("Starting file processing loop")
+    file_results = parse_sales_files(input_files, parallel)
+    extra_headers_set = set() # To collect unique extra headers (stores original casing)
+    errors = []
+    for file_headers, _, file_errors in file_results:
+        extra_headers_set.update(file_headers[len(FIXED_HEADERS):])
+        errors.extend(file_errors)
 
     logging.debug("Finished file processing loop")
     extra_headers_list = sorted(list(extra_headers_set))
-    final_headers = fixed_headers + extra_headers_list
+    final_headers = FIXED_HEADERS + extra_headers_list
     logging.info(f"Final headers for detail sheets: {final_headers}")
 
-    data_by_type = {"B2B": [], "B2C": [], "Others": []}
-    for row_data in all_data:
-        inv_type = str(row_data.get('Invoice Type', '')).strip()
-        if inv_type == "B2B": data_by_type["B2B"].append(row_data)
-        elif inv_type == "B2C": data_by_type["B2C"].append(row_data)
-        else:
-            data_by_type["Others"].append(row_data)
-            if inv_type not in ["B2B", "B2C", ""]:
-                logging.debug(f"Row categorized as 'Others' due to Invoice Type: '{inv_type}' from Invoice: {row_data.get('Invoice Number')}")
-
-    for key, data_list in data_by_type.items():
-        logging.debug(f"Sorting data for category: {key}")
-        data_list.sort(key=lambda x: (x.get('Invoice Date', datetime.datetime.min) if isinstance(x.get('Invoice Date'), datetime.datetime) else datetime.datetime.min,
-                                      str(x.get('Invoice Number', ''))))
-    all_data.sort(key=lambda x: (x.get('Invoice Date', datetime.datetime.min) if isinstance(x.get('Invoice Date'), datetime.datetime) else datetime.datetime.min,
-                                 str(x.get('Invoice Number', ''))))
-    def sort_key_sws(row):
-        receiver = str(row.get('Receiver Name', '')).strip().lower()
-        date = row.get('Invoice Date', datetime.datetime.min)
-        inv_num = str(row.get('Invoice Number', ''))
-        if receiver in ['cash', '(cancelled )'] or not receiver: return (1, receiver, date, inv_num)
-        return (0, receiver, date, inv_num)
-    all_data_sws = sorted(all_data, key=sort_key_sws)
+    # Every record is one list in final_headers order; the detail sheets share these lists
+    all_rows = []
+    for file_headers, file_rows, _ in file_results:
+        if file_headers == final_headers:
+            all_rows.extend(file_rows)
+            continue
+        file_idx_for = {h: i for i, h in enumerate(file_headers)}
+        source_indices = [file_idx_for.get(h) for h in final_headers]
+        for row in file_rows:
+            all_rows.append([row[i] if i is not None else '' for i in source_indices])
+    del file_results
+
+    date_idx = final_headers.index('Invoice Date')
+    inv_num_idx = final_headers.index('Invoice Number')
+    inv_type_idx = final_headers.index('Invoice Type')
+    receiver_idx = final_headers.index('Receiver Name')
+
+    # Both orderings are keyed in one pass, then only indices are sorted. The receiver-wise order is
+    # sorted from the date order so ties keep it, exactly like re-sorting the sorted rows.
+    # Invoice Number and Receiver Name are strictly textual, so they are already stripped strings.
+    date_keys = []
+    sws_keys = [] # cash/cancelled/blank receivers sort last
+    for row_values in all_rows:
+        date_val = row_values[date_idx]
+        inv_num_str = row_values[inv_num_idx]
+        receiver = row_values[receiver_idx].lower()
+        date_keys.append((date_val if isinstance(date_val, datetime.datetime) else MIN_DATETIME, inv_num_str))
+        sws_keys.append((1 if receiver in ('cash', '(cancelled )') or not receiver else 0, receiver, date_val, inv_num_str))
+    date_order = sorted(range(len(all_rows)), key=date_keys.__getitem__)
+    sws_order = sorted(date_order, key=sws_keys.__getitem__)
+    all_rows_sws = [all_rows[i] for i in sws_order]
+    all_rows = [all_rows[i] for i in date_order] # Stable order means each category filtered from it stays sorted
+    del date_keys, sws_keys
     logging.debug("Completed data sorting")
 
+    record_types = [] # Category of each record in all_rows, reused by the monthly summaries
+    rows_by_type = {"B2B": [], "B2C": [], "Others": []}
+    other_invoice_types = Counter() # Unexpected non-blank types, reported once instead of per row
+    for row_values in all_rows:
+        inv_type = row_values[inv_type_idx] # Already a stripped string (text_conversion)
+        category = CATEGORY_FOR_INVOICE_TYPE.get(inv_type, "Others")
+        if category == "Others" and inv_type:
+            other_invoice_types[inv_type] += 1
+        record_types.append(category)
+        rows_by_type[category].append(row_values)
+    if other_invoice_types:
+        logging.debug(f"Rows categorized as 'Others' by Invoice Type: {dict(other_invoice_types)}")
+
+    summary_sheets_data_map = [
+        ("SALE-Summary-Total", "Total", all_rows), ("SALE-Summary-B2B", "B2B", rows_by_type["B2B"]),
+        ("SALE-Summary-B2C", "B2C", rows_by_type["B2C"]), ("SALE-Summary-Others", "Others", rows_by_type["Others"]) ]
+    summary_headers = ['Month', 'No. of Records', 'Invoice Value', 'Taxable Value', 'Integrated Tax',
+                       'Central Tax', 'State/UT Tax', 'Cess']
+    summary_col_format_map = {h: INDIAN_NUMBER_FORMAT for h in summary_headers if h not in ['Month', 'No. of Records']}
+    months_order = ['April', 'May', 'June', 'July', 'August', 'September',
+                    'October', 'November', 'December', 'January', 'February', 'March']
+    fields_to_sum_in_summary = summary_headers[2:]
+    sum_field_indices = [final_headers.index(h) for h in fields_to_sum_in_summary]
+    # Number format (or None) for each summary header's Total cell, in 0-based summary column order
+    summary_total_formats = [summary_col_format_map.get(h) for h in summary_headers] # Month and No. of Records totals stay unformatted
+    summary_format_cols = [(i, summary_col_format_map[h]) for i, h in enumerate(summary_headers) if h in summary_col_format_map]
+
+    summed_values = itemgetter(*sum_field_indices)
+
+    def summary_values(row_values, invoice_num_val):
+        values_to_add = []
+        for field_key, field_idx in zip(fields_to_sum_in_summary, sum_field_indices):
+            value_to_add = row_values[field_idx]
+            if isinstance(value_to_add, (int, float)) and math.isfinite(value_to_add):
+                values_to_add.append(float(value_to_add))
+            else:
+                if value_to_add is not None and str(value_to_add).strip() not in ['', '0', '0.0']:
+                    logging.warning(f"Non-numeric or invalid value '{value_to_add}' for '{field_key}' in summary for invoice '{invoice_num_val}', treating as 0.")
+                values_to_add.append(0.0)
+        return values_to_add
+
+    # One pass over all records feeds the Total summary and the record's own category summary.
+    # It runs before the detail sheets because those replace the dates with display strings.
+    # Each category keeps twelve financial-year month slots, each a ([sums], unique invoice set) pair,
+    # so a row touches a month with one lookup per category.
+    month_slots = {key: [None] * 12 for key in ("Total", "B2B", "B2C", "Others")}
+    for row_values, row_type in zip(all_rows, record_types):
+        date_obj = row_values[date_idx]
+        invoice_num_val = row_values[inv_num_idx] # Already a stripped string (text_conversion)
+        if not isinstance(date_obj, datetime.datetime) or not invoice_num_val:
+            if debug_enabled: logging.debug(f"Skipping summary calculation for row due to missing date/invoice: {row_values[inv_num_idx]}")
+            continue
+        month_idx = FY_MONTH_SLOT[date_obj.month]
+        values_to_add = summed_values(row_values)
+        # The converters hand back floats, so the per-value checks only run when one is missing
+        # or non-finite (any nan/inf makes the sum non-finite)
+        if not (all(type(value_to_add) is float for value_to_add in values_to_add) and math.isfinite(sum(values_to_add))):
+            values_to_add = summary_values(row_values, invoice_num_val)
+        for key in ("Total", row_type):
+            slots = month_slots[key]
+            slot = slots[month_idx]
+            if slot is None:
+                slot = slots[month_idx] = ([0.0] * len(values_to_add), set())
+            sums, invoices = slot
+            invoices.add(invoice_num_val) # Counted once per month via len() when the summary is built
+            sums[:] = map(add, sums, values_to_add) # Element-wise, in the same order as a per-field loop
+
+    for row_values in all_rows:
+        if isinstance(row_values[date_idx], datetime.datetime):
+            row_values[date_idx] = format_date(row_values[date_idx])
+
     if existing_wb is not None: output_wb = existing_wb
     elif template_file: output_wb = load_workbook(template_file)
     else:
-        output_wb = Workbook()
-        if 'Sheet' in output_wb.sheetnames and len(output_wb.sheetnames) == 1: del output_wb['Sheet']
+        output_wb = Workbook(write_only=True) # Nothing is read back from a fresh workbook, so stream it
+    write_only = output_wb.write_only
 
     col_format_map = {
         'Invoice Date': 'DD-MM-YYYY',
@@ -432,98 +630,80 @@ def process_excel_data(input_files, template_file=None, existing_wb=None):
     for eh in extra_headers_list:
         if eh not in col_format_map: col_format_map[eh] = INDIAN_NUMBER_FORMAT
 
+    # Column 0 carries the 'Total' label; text columns are never summed
+    total_col_indices = [i for i, h in enumerate(final_headers) if i > 0 and h not in EXCLUDE_FROM_TOTAL_HEADERS]
+    detail_format_cols = [(i, col_format_map[h]) for i, h in enumerate(final_headers) if h in col_format_map]
+    detail_total_formats = [INDIAN_NUMBER_FORMAT] * len(final_headers) # Numeric detail totals all take the Indian format
+
     sheets_to_create = [
-        ("SALE-Total", all_data), ("SALE-Total_sws", all_data_sws),
-        ("SALE-B2B", data_by_type.get("B2B", [])), ("SALE-B2C", data_by_type.get("B2C", [])),
-        ("SALE-Others", data_by_type.get("Others", [])) ]
+        ("SALE-Total", all_rows), ("SALE-Total_sws", all_rows_sws),
+        ("SALE-B2B", rows_by_type["B2B"]), ("SALE-B2C", rows_by_type["B2C"]),
+        ("SALE-Others", rows_by_type["Others"]) ]
 
-    for sheet_name_key, data_list_for_sheet in sheets_to_create:
-        if not data_list_for_sheet:
+    for sheet_name_key, sheet_rows in sheets_to_create:
+        if not sheet_rows:
             logging.info(f"No data for sheet: {sheet_name_key}, skipping creation.")
             continue
         logging.info(f"Starting population of sheet: {sheet_name_key}")
-        display_title = next((t for n, t in SECTION_TITLES if n == sheet_name_key), sheet_name_key)
+        display_title = SECTION_TITLE_MAP.get(sheet_name_key, sheet_name_key)
+        col_totals = [0.0] * len(final_headers)
+        col_has_num = [False] * len(final_headers)
+        col_widths = [len(str(h)) for h in final_headers]
+        for row_values in sheet_rows:
+            for col_idx, value in enumerate(row_values):
+                if value is not None:
+                    value_len = len(str(value))
+                    if value_len > col_widths[col_idx]:
+                        col_widths[col_idx] = value_len
+            for col_idx in total_col_indices:
+                value = row_values[col_idx]
+                if isinstance(value, (int, float)) and math.isfinite(value):
+                    col_totals[col_idx] += value # col_totals start as floats, so no cast is needed
+                    col_has_num[col_idx] = True
+        total_row_data = ['Total'] + [col_totals[i] if col_has_num[i] else '' for i in range(1, len(final_headers))]
+        for col_idx, value in enumerate(total_row_data):
+            col_widths[col_idx] = max(col_widths[col_idx], len(str(value)))
+        if write_only:
+            write_only_sheet(output_wb, sheet_name_key, display_title, final_headers, sheet_rows,
+                             total_row_data, col_widths, col_format_map=col_format_map)
+            logging.info(f"Completed population of sheet: {sheet_name_key}")
+            continue
         ws = create_or_replace_sheet(output_wb, sheet_name_key, display_title, final_headers)
-        current_start_row = 3
-        for row_data_item in data_list_for_sheet:
-            row_values_to_append = []
-            for header_name in final_headers:
-                value = row_data_item.get(header_name, '')
-                if header_name == 'Invoice Date' and isinstance(value, datetime.datetime):
-                    value = value.strftime('%d-%m-%Y')
-                row_values_to_append.append(value)
-            ws.append(row_values_to_append)
-        add_total_row(ws, final_headers, current_start_row, ws.max_row)
-        apply_format_and_autofit(ws, final_headers, col_format_map=col_format_map, start_row=current_start_row)
+        for row_values in sheet_rows:
+            ws.append(format_row(ws, row_values, detail_format_cols))
+        ws.append(total_row_cells(ws, total_row_data, detail_total_formats))
+        set_column_widths(ws, col_widths)
         logging.info(f"Completed population of sheet: {sheet_name_key}")
 
-    summary_sheets_data_map = [
-        ("SALE-Summary-Total", all_data), ("SALE-Summary-B2B", data_by_type.get("B2B", [])),
-        ("SALE-Summary-B2C", data_by_type.get("B2C", [])), ("SALE-Summary-Others", data_by_type.get("Others", [])) ]
-    summary_headers = ['Month', 'No. of Records', 'Invoice Value', 'Taxable Value', 'Integrated Tax',
-                       'Central Tax', 'State/UT Tax', 'Cess']
-    summary_col_format_map = {h: INDIAN_NUMBER_FORMAT for h in summary_headers if h not in ['Month', 'No. of Records']}
-    months_order = ['April', 'May', 'June', 'July', 'August', 'September',
-                    'October', 'November', 'December', 'January', 'February', 'March']
-
-    for sheet_name_key, data_for_summary in summary_sheets_data_map:
-        if not data_for_summary:
+    for sheet_name_key, category_key, category_rows in summary_sheets_data_map:
+        if not category_rows:
             logging.info(f"No data for summary sheet: {sheet_name_key}, skipping creation.")
             continue
         logging.info(f"Starting population of summary sheet: {sheet_name_key}")
-        display_title = next((t for n, t in SECTION_TITLES if n == sheet_name_key), sheet_name_key)
-        ws_summary = create_or_replace_sheet(output_wb, sheet_name_key, display_title, summary_headers)
-        monthly_summary_data = {}
-        unique_invoices_by_month = {}
-        for row_item in data_for_summary:
-            date_obj = row_item.get('Invoice Date')
-            invoice_num_val = str(row_item.get('Invoice Number', '')).strip()
-            if not isinstance(date_obj, datetime.datetime) or not invoice_num_val:
-                logging.debug(f"Skipping summary calculation for row due to missing date/invoice: {row_item.get('Invoice Number')}")
-                continue
-            month_index = (date_obj.month - 4 + 12) % 12
-            month_name = months_order[month_index]
-            if month_name not in monthly_summary_data:
-                monthly_summary_data[month_name] = {h: 0.0 for h in summary_headers if h not in ['Month']}
-                monthly_summary_data[month_name]['count'] = 0
-                unique_invoices_by_month[month_name] = set()
-            if invoice_num_val not in unique_invoices_by_month[month_name]:
-                monthly_summary_data[month_name]['count'] += 1
-                unique_invoices_by_month[month_name].add(invoice_num_val)
-            fields_to_sum_in_summary = ['Invoice Value', 'Taxable Value', 'Integrated Tax', 'Central Tax', 'State/UT Tax', 'Cess']
-            for field_key in fields_to_sum_in_summary:
-                value_to_add = row_item.get(field_key, 0.0)
-                if isinstance(value_to_add, (int, float)) and not (math.isnan(value_to_add) or math.isinf(value_to_add)):
-                    monthly_summary_data[month_name][field_key] += float(value_to_add)
-                elif value_to_add is not None and str(value_to_add).strip() not in ['', '0', '0.0']:
-                     logging.warning(f"Non-numeric or invalid value '{value_to_add}' for '{field_key}' in summary for invoice '{invoice_num_val}', treating as 0.")
-
-        summary_start_row = 3
-        rows_added_to_summary = 0
-        for month_n in months_order:
-            if month_n in monthly_summary_data:
-                month_data = monthly_summary_data[month_n]
-                ws_summary.append([ month_n, month_data['count'], month_data['Invoice Value'], month_data['Taxable Value'],
-                    month_data['Integrated Tax'], month_data['Central Tax'], month_data['State/UT Tax'], month_data['Cess'] ])
-                rows_added_to_summary += 1
-        if rows_added_to_summary > 0:
-            summary_total_row_values = ['Total'] + [0.0] * (len(summary_headers) - 1)
-            for col_idx_summary in range(1, len(summary_headers)):
-                current_col_total = 0.0
-                for r_idx in range(summary_start_row, summary_start_row + rows_added_to_summary):
-                    cell_val = ws_summary.cell(row=r_idx, column=col_idx_summary + 1).value
-                    if isinstance(cell_val, (int, float)) and not (math.isnan(cell_val) or math.isinf(cell_val)):
-                        current_col_total += float(cell_val)
-                summary_total_row_values[col_idx_summary] = current_col_total
-            ws_summary.append(summary_total_row_values)
-            total_row_number_on_sheet = summary_start_row + rows_added_to_summary
-            for c_idx, val in enumerate(summary_total_row_values, start=1):
-                total_cell = ws_summary.cell(row=total_row_number_on_sheet, column=c_idx)
-                total_cell.font = Font(bold=True, color="FF0000")
-                if isinstance(val, (int, float)) and summary_headers[c_idx - 1] not in ['Month', 'No. of Records']:
-                    total_cell.number_format = INDIAN_NUMBER_FORMAT
-        apply_format_and_autofit(ws_summary, summary_headers, col_format_map=summary_col_format_map, start_row=summary_start_row)
+        display_title = SECTION_TITLE_MAP.get(sheet_name_key, sheet_name_key)
+        summary_rows = []
+        summary_totals = [0.0] * (len(summary_headers) - 1) # Month sums are finite, so the totals need no guards
+        for month_n, slot in zip(months_order, month_slots[category_key]):
+            if slot is not None:
+                sums, invoices = slot
+                summary_row = [month_n, len(invoices)] + sums
+                summary_rows.append(summary_row)
+                summary_totals[:] = map(add, summary_totals, summary_row[1:])
+        if not summary_rows: # No record had a usable date/invoice number; don't create an empty summary sheet
+            logging.info(f"Skipping empty summary sheet {sheet_name_key}")
+            continue
+        summary_total_row_values = ['Total'] + summary_totals
+        summary_widths = rendered_widths(summary_headers, summary_rows + [summary_total_row_values])
+        if write_only:
+            write_only_sheet(output_wb, sheet_name_key, display_title, summary_headers, summary_rows, summary_total_row_values,
+                             summary_widths, col_format_map=summary_col_format_map, total_number_format=None)
+        else:
+            ws_summary = create_or_replace_sheet(output_wb, sheet_name_key, display_title, summary_headers)
+            for summary_row in summary_rows:
+                ws_summary.append(format_row(ws_summary, summary_row, summary_format_cols))
+            ws_summary.append(total_row_cells(ws_summary, summary_total_row_values, summary_total_formats))
+            set_column_widths(ws_summary, summary_widths)
         logging.info(f"Completed population of summary sheet: {sheet_name_key}")
 
     logging.info("Completed sales data processing")
-    return output_wb
\ No newline at end of file
+    return output_wb, errors
\ No newline at end of file
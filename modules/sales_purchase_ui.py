@@ -3,10 +3,13 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 import os
+import re
+import threading
 from openpyxl import Workbook, load_workbook
 import logging
 import traceback  # For detailed error reporting
 from collections import Counter  # For update_process_button_state logic if needed
+from itertools import chain
 
 # Attempt to import processor functions and telemetry
 try:
@@ -36,6 +39,7 @@ except ImportError:
     process_purchase_data = None
 
 PLACEHOLDER_TEXT = "Code"  # Placeholder for branch code
+BRANCH_KEY_PATTERN = re.compile(r"[^_.-]*")  # File name prefix up to the first '_', '-' or '.' is the branch code
 
 
 class CustomErrorDialog(tk.Toplevel):
@@ -117,11 +121,13 @@ class SalesPurchaseProcessorUI:
         self.root = root
         self.root.title("Process Sales / Purchase")
 
-        self.sales_files = []  # List of tuples: (filepath, branch_code)
-        self.purchase_files = []  # List of tuples: (filepath, branch_code)
+        self.sales_files = {}  # filepath -> branch_code, in the order the files were added
+        self.purchase_files = {}  # filepath -> branch_code, in the order the files were added
         self.template_file = None
+        self.last_dir = None  # Folder of the last picked file; file dialogs reopen there
         self.base_height = 500
-        self.warning_frame_height_addition = 100
+        self.warning_frame_height_addition = None  # Measured the first time the warning is shown; its contents are fixed
+        self._processing = False  # True while a report is being built on the worker thread
 
         self.root.geometry(f"500x{self.base_height}")
 
@@ -133,35 +139,51 @@ class SalesPurchaseProcessorUI:
         left_frame = tk.Frame(main_frame)
         left_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(0, 5))
         tk.Label(left_frame, text="Sales Ledger Excel Files", font=("Arial", 10, "bold")).pack()
-        self.sales_tree = ttk.Treeview(left_frame, columns=("File Name", "Branch Code"),
+        # The tree keeps its fixed 13-row height; longer lists scroll instead of growing the window
+        sales_tree_frame = tk.Frame(left_frame)
+        sales_tree_frame.pack(pady=2, fill=tk.BOTH, expand=True)
+        self.sales_tree = ttk.Treeview(sales_tree_frame, columns=("File Name", "Branch Code"),
                                        show="headings", height=13)
+        sales_scrollbar = ttk.Scrollbar(sales_tree_frame, orient=tk.VERTICAL, command=self.sales_tree.yview)
+        self.sales_tree.configure(yscrollcommand=sales_scrollbar.set)
+        sales_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.sales_tree.heading("File Name", text="File Name")
         self.sales_tree.heading("Branch Code", text="Branch Code")
         self.sales_tree.column("File Name", width=140, stretch=True)
         self.sales_tree.column("Branch Code", width=85, stretch=True)
-        self.sales_tree.pack(pady=2, fill=tk.BOTH, expand=True)
+        self.sales_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         self.sales_tree.bind("<Double-1>", self.edit_sales_branch_code)
         btn_frame_sales = tk.Frame(left_frame)
         btn_frame_sales.pack(pady=5)
-        tk.Button(btn_frame_sales, text="+ Add", command=self.add_sales_file).pack(side=tk.LEFT, padx=5)
-        tk.Button(btn_frame_sales, text="- Remove", command=self.delete_sales_file).pack(side=tk.LEFT, padx=5)
+        add_sales_btn = tk.Button(btn_frame_sales, text="+ Add", command=self.add_sales_file)
+        add_sales_btn.pack(side=tk.LEFT, padx=5)
+        remove_sales_btn = tk.Button(btn_frame_sales, text="- Remove", command=self.delete_sales_file)
+        remove_sales_btn.pack(side=tk.LEFT, padx=5)
 
         # Purchase Section
         right_frame = tk.Frame(main_frame)
         right_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(5, 0))
         tk.Label(right_frame, text="Purchase Register Excel Files", font=("Arial", 10, "bold")).pack()
-        self.purchase_tree = ttk.Treeview(right_frame, columns=("File Name", "Branch Code"),
+        # The tree keeps its fixed 13-row height; longer lists scroll instead of growing the window
+        purchase_tree_frame = tk.Frame(right_frame)
+        purchase_tree_frame.pack(pady=2, fill=tk.BOTH, expand=True)
+        self.purchase_tree = ttk.Treeview(purchase_tree_frame, columns=("File Name", "Branch Code"),
                                           show="headings", height=13)
+        purchase_scrollbar = ttk.Scrollbar(purchase_tree_frame, orient=tk.VERTICAL, command=self.purchase_tree.yview)
+        self.purchase_tree.configure(yscrollcommand=purchase_scrollbar.set)
+        purchase_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.purchase_tree.heading("File Name", text="File Name")
         self.purchase_tree.heading("Branch Code", text="Branch Code")
         self.purchase_tree.column("File Name", width=140, stretch=True)
         self.purchase_tree.column("Branch Code", width=85, stretch=True)
-        self.purchase_tree.pack(pady=2, fill=tk.BOTH, expand=True)
+        self.purchase_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         self.purchase_tree.bind("<Double-1>", self.edit_purchase_branch_code)
         btn_frame_purchase = tk.Frame(right_frame)
         btn_frame_purchase.pack(pady=5)
-        tk.Button(btn_frame_purchase, text="+ Add", command=self.add_purchase_file).pack(side=tk.LEFT, padx=5)
-        tk.Button(btn_frame_purchase, text="- Remove", command=self.delete_purchase_file).pack(side=tk.LEFT, padx=5)
+        add_purchase_btn = tk.Button(btn_frame_purchase, text="+ Add", command=self.add_purchase_file)
+        add_purchase_btn.pack(side=tk.LEFT, padx=5)
+        remove_purchase_btn = tk.Button(btn_frame_purchase, text="- Remove", command=self.delete_purchase_file)
+        remove_purchase_btn.pack(side=tk.LEFT, padx=5)
 
         # Template File Section
         self.template_frame = tk.Frame(root)  # Made template_frame an instance variable
@@ -169,13 +191,20 @@ class SalesPurchaseProcessorUI:
         tk.Label(self.template_frame, text="Template Excel File (Optional):").pack(side=tk.LEFT)
         self.template_label = tk.Label(self.template_frame, text="No file selected")
         self.template_label.pack(side=tk.LEFT, padx=5)
-        tk.Button(self.template_frame, text="Select", command=self.select_template).pack(side=tk.LEFT, padx=2)
-        tk.Button(self.template_frame, text="Clear", command=self.clear_template).pack(side=tk.LEFT, padx=2)
+        select_template_btn = tk.Button(self.template_frame, text="Select", command=self.select_template)
+        select_template_btn.pack(side=tk.LEFT, padx=2)
+        clear_template_btn = tk.Button(self.template_frame, text="Clear", command=self.clear_template)
+        clear_template_btn.pack(side=tk.LEFT, padx=2)
+        # Disabled while a report is being built so the file lists and template stay as the run saw them
+        self.input_controls = (add_sales_btn, remove_sales_btn, add_purchase_btn, remove_purchase_btn,
+                               select_template_btn, clear_template_btn)
 
         # Process Button
         self.process_btn = tk.Button(root, text="Process Sales / Purchase", font=("Arial", 12), width=25,
                                      command=self.process_files, state=tk.DISABLED, bg="light grey")
         self.process_btn.pack(pady=10)
+        # Shown below the button only while a report is being built
+        self.progress_bar = ttk.Progressbar(root, mode='indeterminate', length=200)
 
         # Warning Frame - will be packed by update_process_button_state if needed
         self.warning_frame = tk.Frame(root, borderwidth=1, relief="solid")
@@ -193,44 +222,40 @@ class SalesPurchaseProcessorUI:
     def _add_file_to_list_and_tree(self, file_list, tree_widget, file_type_name_for_dialog):
         files = filedialog.askopenfilenames(
             title=f"Select {file_type_name_for_dialog} Excel Files",
-            filetypes=[("Excel Files", "*.xlsx *.xls")]
+            filetypes=[("Excel Files", "*.xlsx *.xls")],
+            initialdir=self.last_dir
         )
+        if files:
+            self.last_dir = os.path.dirname(files[0])
         for file_path in files:
-            if not any(f[0] == file_path for f in file_list):
+            if file_path not in file_list:
                 base = os.path.basename(file_path)
-                extracted_branch_key = base.split('_')[0].split('-')[0].split('.')[0] if base else ""
+                extracted_branch_key = BRANCH_KEY_PATTERN.match(base).group()
 
                 if extracted_branch_key == os.path.splitext(base)[0]:
                     stored_branch_code = ""
                 else:
                     stored_branch_code = extracted_branch_key.strip()
 
-                file_list.append((file_path, stored_branch_code))
+                file_list[file_path] = stored_branch_code
                 display_code = stored_branch_code if stored_branch_code else PLACEHOLDER_TEXT
-                tree_widget.insert("", tk.END, values=(os.path.basename(file_path), display_code))
+                # The row's item id is its file path, so selected rows map straight to file_list keys
+                tree_widget.insert("", tk.END, iid=file_path, values=(base, display_code))
         self.update_process_button_state()
 
     def _delete_selected_from_list_and_tree(self, file_list, tree_widget):
         selected_tree_items = tree_widget.selection()
-        items_to_remove_from_data = []
-
-        for item_id in selected_tree_items:
-            filename_in_tree = tree_widget.item(item_id, "values")[0]
-            for i, (fp, bc) in enumerate(file_list):
-                if os.path.basename(fp) == filename_in_tree:
-                    items_to_remove_from_data.append(file_list[i])
-                    break
-            tree_widget.delete(item_id)
-
-        for item_data in items_to_remove_from_data:
-            if item_data in file_list:
-                file_list.remove(item_data)
-            else:
-                logging.warning(f"Tried to remove non-existent item: {item_data}")
+        for item_id in selected_tree_items:  # Item ids are the file paths
+            if file_list.pop(item_id, None) is None:
+                logging.warning(f"Tried to remove non-existent item: {item_id}")
+        if selected_tree_items:
+            tree_widget.delete(*selected_tree_items)  # One Tcl call for the whole selection
 
         self.update_process_button_state()
 
     def _edit_branch_code_in_tree(self, event, file_list, tree_widget):
+        if self._processing:  # The tree cannot be disabled like the buttons, so edits are ignored during a run
+            return
         item_id = tree_widget.identify_row(event.y)
         column_id = tree_widget.identify_column(event.x)
 
@@ -238,17 +263,12 @@ class SalesPurchaseProcessorUI:
             return
 
         current_filename_display = tree_widget.item(item_id, "values")[0]
-        list_idx = -1
-        for i, (fp, bc) in enumerate(file_list):
-            if os.path.basename(fp) == current_filename_display:
-                list_idx = i  # Simpler direct match, assuming basename is unique enough in the list for UI
-                break
-
-        if list_idx == -1:
+        file_path = item_id  # Item ids are the file paths
+        if file_path not in file_list:
             logging.error(f"Could not find {current_filename_display} in internal file list for branch code edit.")
             return
 
-        stored_branch_code = file_list[list_idx][1]
+        stored_branch_code = file_list[file_path]
 
         entry = tk.Entry(tree_widget)
         entry.insert(0, stored_branch_code if stored_branch_code else "")
@@ -261,7 +281,7 @@ class SalesPurchaseProcessorUI:
 
         def save_edited_branch_code(evt):
             new_code_input = entry.get().strip()
-            file_list[list_idx] = (file_list[list_idx][0], new_code_input)
+            file_list[file_path] = new_code_input
 
             display_text = new_code_input if new_code_input else PLACEHOLDER_TEXT
             tree_widget.item(item_id, values=(current_filename_display, display_text))
@@ -291,8 +311,9 @@ class SalesPurchaseProcessorUI:
         self._edit_branch_code_in_tree(event, self.purchase_files, self.purchase_tree)
 
     def select_template(self):
-        file = filedialog.askopenfilename(filetypes=[("Excel Files", "*.xlsx *.xls")])
+        file = filedialog.askopenfilename(filetypes=[("Excel Files", "*.xlsx *.xls")], initialdir=self.last_dir)
         if file:
+            self.last_dir = os.path.dirname(file)
             self.template_file = file
             self.template_label.config(text=os.path.basename(file))
 
@@ -304,39 +325,41 @@ class SalesPurchaseProcessorUI:
         has_files = bool(self.sales_files or self.purchase_files)
         # Check if any branch code is empty OR is still the placeholder
         missing_branch_code = any(not code.strip() or code == PLACEHOLDER_TEXT
-                                  for _, code in self.sales_files + self.purchase_files)
+                                  for code in chain(self.sales_files.values(), self.purchase_files.values()))
 
         if missing_branch_code and has_files:
+            # The warning and the window size only change when the warning first appears, so the
+            # forced layout pass (update_idletasks) is not repeated on every add/edit while it is shown
             if not self.warning_frame.winfo_ismapped():
                 # Pack warning frame *after* the process button to match original intent
                 self.warning_frame.pack(pady=5, padx=10, fill=tk.X, after=self.process_btn)
-            self.warning_title.pack(pady=(5, 0))
-            self.warning_text.config(
-                text="Warning: Branch Code is missing. Please double-click to edit or check 'Ignore Warning'.")
-            self.warning_text.pack(pady=2)
-            self.ignore_check.pack(pady=2)
-
-            self.root.update_idletasks()
-            current_warning_frame_height = self.warning_frame.winfo_reqheight()
-            self.root.geometry(f"500x{self.base_height + current_warning_frame_height + 10}")
-
-            if has_files and self.ignore_var.get():
-                self.process_btn.config(state=tk.NORMAL, bg="light green")
-            else:
-                self.process_btn.config(state=tk.DISABLED, bg="light grey")
+                self.warning_title.pack(pady=(5, 0))
+                self.warning_text.config(
+                    text="Warning: Branch Code is missing. Please double-click to edit or check 'Ignore Warning'.")
+                self.warning_text.pack(pady=2)
+                self.ignore_check.pack(pady=2)
+
+                if self.warning_frame_height_addition is None:
+                    self.root.update_idletasks()  # One layout pass to measure the frame; later shows reuse it
+                    self.warning_frame_height_addition = self.warning_frame.winfo_reqheight() + 10
+                self.root.geometry(f"500x{self.base_height + self.warning_frame_height_addition}")
+
+            can_process = self.ignore_var.get()
         else:
             if self.warning_frame.winfo_ismapped():
                 self.warning_frame.pack_forget()
                 self.warning_title.pack_forget()
                 self.warning_text.pack_forget()
                 self.ignore_check.pack_forget()
-                self.root.update_idletasks()
-            self.root.geometry(f"500x{self.base_height}")
+                self.root.geometry(f"500x{self.base_height}")  # A fixed size needs no layout pass first
 
-            if has_files:
-                self.process_btn.config(state=tk.NORMAL, bg="light green")
-            else:
-                self.process_btn.config(state=tk.DISABLED, bg="light grey")
+            can_process = has_files
+
+        # A report still being built keeps the button disabled, so a second run cannot start alongside it
+        if can_process and not self._processing:
+            self.process_btn.config(state=tk.NORMAL, bg="light green")
+        else:
+            self.process_btn.config(state=tk.DISABLED, bg="light grey")
 
     def process_files(self):
         if not (self.sales_files or self.purchase_files):
@@ -351,7 +374,7 @@ class SalesPurchaseProcessorUI:
             return
 
         missing_branch_code_strict = any(not code.strip() or code == PLACEHOLDER_TEXT
-                                         for _, code in self.sales_files + self.purchase_files)
+                                         for code in chain(self.sales_files.values(), self.purchase_files.values()))
         if missing_branch_code_strict and not self.ignore_var.get():
             messagebox.showwarning("Branch Code Missing",
                                    "Please review branch codes (cannot be empty or placeholder) or check 'Ignore Warning' to proceed.")
@@ -360,9 +383,9 @@ class SalesPurchaseProcessorUI:
 
         default_branch_for_processor = "Default_Branch"
         sales_to_process = [(f, c.strip() if (c.strip() and c != PLACEHOLDER_TEXT) else default_branch_for_processor)
-                            for f, c in self.sales_files]
+                            for f, c in self.sales_files.items()]
         purchase_to_process = [(f, c.strip() if (c.strip() and c != PLACEHOLDER_TEXT) else default_branch_for_processor)
-                               for f, c in self.purchase_files]
+                               for f, c in self.purchase_files.items()]
 
         save_file = filedialog.asksaveasfilename(defaultextension=".xlsx",
                                                  filetypes=[("Excel Files", "*.xlsx")],
@@ -371,61 +394,93 @@ class SalesPurchaseProcessorUI:
         if not save_file:
             return
 
+        self._processing = True
         self.process_btn.config(text="Processing...", state=tk.DISABLED, bg="light grey")
-        self.root.update_idletasks()
-
+        for control in self.input_controls:
+            control.config(state=tk.DISABLED)
+        self.progress_bar.pack(after=self.process_btn, pady=(0, 5))
+        self.progress_bar.start(10)
+        # The processors and the save run on a worker thread so the window keeps repainting;
+        # the results come back to the Tk thread through root.after
+        threading.Thread(target=self._run_processing,
+                         args=(sales_to_process, purchase_to_process, save_file, self.template_file),
+                         daemon=True).start()
+
+    def _run_processing(self, sales_to_process, purchase_to_process, save_file, template_file):
+        # Worker thread: no widget access here
         try:
-            if self.template_file:
-                wb = load_workbook(self.template_file)
+            if template_file:
+                wb = load_workbook(template_file)
             else:
-                wb = Workbook()
-                if 'Sheet' in wb.sheetnames and len(wb.sheetnames) == 1:
-                    del wb['Sheet']
+                # Both processors stream into write-only workbooks, so nothing is held as Cell objects until save
+                wb = Workbook(write_only=True)
 
+            # Per-file (title, message) errors from the processors; shown on the Tk thread once done
+            file_errors = []
             if sales_to_process and process_excel_data:
-                wb = process_excel_data(sales_to_process, template_file=None, existing_wb=wb)
+                wb, sales_errors = process_excel_data(sales_to_process, template_file=None, existing_wb=wb)
+                file_errors.extend(sales_errors)
             if purchase_to_process and process_purchase_data:
-                wb = process_purchase_data(purchase_to_process, template_file=None, existing_wb=wb)
+                wb, purchase_errors = process_purchase_data(purchase_to_process, template_file=None, existing_wb=wb)
+                file_errors.extend(purchase_errors)
 
             wb.save(save_file)
-
-            send_event("sales_purchase_complete", {
-                "sales_files_count": len(sales_to_process),
-                "purchase_files_count": len(purchase_to_process),
-                "output_file": save_file,
-                "template_used": bool(self.template_file)
-            })
-
-            messagebox.showinfo("Success", f"Report saved successfully at:\n{save_file}")
-            self.sales_files.clear()
-            self.purchase_files.clear()
-            self.sales_tree.delete(*self.sales_tree.get_children())
-            self.purchase_tree.delete(*self.purchase_tree.get_children())
-            self.ignore_var.set(False)
-            self.clear_template()
         except Exception as e:
-            detailed_error_info = traceback.format_exc()
-            logging.error(f"An error occurred during processing: {str(e)}", exc_info=True)
-            print("--- SALES/PURCHASE UI ERROR DETAILS ---")
-            print(detailed_error_info)
-            print("---------------------------------------")
-
-            send_event("error", {
-                "module": "sales_purchase_ui.process_files",
-                "error_type": type(e).__name__,
-                "error_message": str(e),
-                "sales_files_count": len(self.sales_files),
-                "purchase_files_count": len(self.purchase_files)
-            })
-            # Use the new CustomErrorDialog
-            CustomErrorDialog(self.root,
-                              "Processing Error",
-                              f"An error occurred during processing:\n\n{type(e).__name__}: {str(e)}\n\nSee console for full traceback if run from command line.",
-                              detailed_error_info)
-        finally:
-            self.process_btn.config(text="Process Sales / Purchase")  # Reset button text
-            self.update_process_button_state()
+            self.root.after(0, self._on_processing_failed, e, traceback.format_exc())
+            return
+        # The processed paths and template go back with the result, so only what this run used is cleared
+        self.root.after(0, self._on_processing_done, [f for f, _ in sales_to_process],
+                        [f for f, _ in purchase_to_process], template_file, save_file, file_errors)
+
+    def _finish_processing(self):
+        self.progress_bar.stop()
+        self.progress_bar.pack_forget()
+        self._processing = False
+        for control in self.input_controls:
+            control.config(state=tk.NORMAL)
+        self.process_btn.config(text="Process Sales / Purchase")  # Reset button text
+        self.update_process_button_state()
 
+    def _on_processing_done(self, sales_paths, purchase_paths, template_file, save_file, file_errors):
+        send_event("sales_purchase_complete", {
+            "sales_files_count": len(sales_paths),
+            "purchase_files_count": len(purchase_paths),
+            "output_file": save_file,
+            "template_used": bool(template_file)
+        })
+
+        for title, message in file_errors:  # Files that could not be read were skipped; report each one
+            messagebox.showerror(title, message)
+        messagebox.showinfo("Success", f"Report saved successfully at:\n{save_file}")
+        for file_list, tree_widget, processed_paths in ((self.sales_files, self.sales_tree, sales_paths),
+                                                        (self.purchase_files, self.purchase_tree, purchase_paths)):
+            removed = [path for path in processed_paths if file_list.pop(path, None) is not None]
+            if removed:
+                tree_widget.delete(*removed)  # Item ids are the file paths
+        self.ignore_var.set(False)
+        if self.template_file == template_file:
+            self.clear_template()
+        self._finish_processing()
+
+    def _on_processing_failed(self, e, detailed_error_info):
+        logging.error(f"An error occurred during processing: {str(e)}", exc_info=(type(e), e, e.__traceback__))
+        print("--- SALES/PURCHASE UI ERROR DETAILS ---")
+        print(detailed_error_info)
+        print("---------------------------------------")
+
+        send_event("error", {
+            "module": "sales_purchase_ui.process_files",
+            "error_type": type(e).__name__,
+            "error_message": str(e),
+            "sales_files_count": len(self.sales_files),
+            "purchase_files_count": len(self.purchase_files)
+        })
+        # Use the new CustomErrorDialog
+        CustomErrorDialog(self.root,
+                          "Processing Error",
+                          f"An error occurred during processing:\n\n{type(e).__name__}: {str(e)}\n\nSee console for full traceback if run from command line.",
+                          detailed_error_info)
+        self._finish_processing()
 
 if __name__ == "__main__":
     if not logging.getLogger().hasHandlers():